@@ -7,13 +7,31 @@ import pandas as pd
 import numpy as np
 from dash.dependencies import Input, Output, State
 from app_functions import *
-from datetime import datetime
 from app_dropdown import *
-import dash_daq as daq
+from app_cache import (
+    format_range,
+    frame_cache,
+    load_stash_frame,
+    make_stash_token,
+    parse_range,
+    parse_stash_token,
+    stash_dates,
+    to_seconds,
+)
+from app_store import RESOLUTION_NS, pick_resolution
+from app_downsample import max_points_for_width
+from app_figures import figure_update
+from app_metrics import register_metrics_routes, timed_callback
 
 
 # Start by displaying L3M
-initial_limit = monthdelta(datetime.today(), -3)
+INITIAL_MONTHS = 3
+
+# Pages driven by the ohlc stash, the overview takes its period from it
+OHLC_PAGES = ["/", "/page-1", "/page-3"]
+
+# Months shown by each quick selector, None for the whole history
+QUICK_SELECTOR_MONTHS = {"1M": 1, "3M": 3, "6M": 6, "1Y": 12, "3Y": 36, "ALL": None}
 
 app = dash.Dash(
     __name__,
@@ -31,6 +49,22 @@ app = dash.Dash(
     ],
 )
 server = app.server
+register_metrics_routes(server)
+
+
+def register_extra_kinds(cache):
+    """
+    Forecast and cross rate kinds of the frame cache, registered by the
+    first request of one of them
+    """
+    from app_crossrate import register_crossrates
+    from app_inference import register_inference
+
+    register_inference(cache)
+    register_crossrates(cache)
+
+
+frame_cache.defer_kinds(register_extra_kinds)
 
 app.title = "Crypto Dashboard"
 
@@ -77,11 +111,11 @@ range_slider_div = dbc.Container(
                         html.P(
                             id="range-min-max-date", className="text-center"
                         ),
+                        # Bounds, step and marks are set with the stash, in
+                        # epoch seconds
                         dcc.RangeSlider(
                             id="my-range-slider",
-                            min=0,
-                            max=15,
-                            step=1,
+                            marks=None,
                             allowCross=False,
                             className="range-slider-style",
                         ),
@@ -110,22 +144,23 @@ shared_selectors = dbc.Card(
         children=[
             # Change to side-by-side for mobile layout
             dbc.Col(
-                style={"display": "none"},
-                className="div-for-dropdown",
+                className="div-for-dropdown col-3",
                 children=[
                     dcc.Dropdown(
                         id="resolution-dropdown",
-                        value="day",
+                        value="1d",
                         options=[
-                            {"label": "hour", "value": "hour"},
-                            {"label": "day", "value": "day"},
+                            {"label": "minute", "value": "1m"},
+                            {"label": "hour", "value": "1h"},
+                            {"label": "day", "value": "1d"},
                         ],
                         placeholder="Select resolution",
+                        clearable=False,
                     )
                 ],
             ),
             dbc.Col(
-                className="div-for-dropdown col-9",
+                className="div-for-dropdown col-4",
                 children=[
                     # Dropdown to select times
                     dcc.Dropdown(
@@ -140,10 +175,9 @@ shared_selectors = dbc.Card(
                     )
                 ],
             ),
-            # Activate When having multiple bases available
+            # Non USD bases are derived from the USDT candles (app_crossrate)
             dbc.Col(
-                style={"display": "none"},
-                className="div-for-dropdown",
+                className="div-for-dropdown col-2",
                 children=[
                     # Dropdown to select times
                     dcc.Dropdown(
@@ -154,6 +188,7 @@ shared_selectors = dbc.Card(
                             for c in ["USD", "BTC", "ETH"]
                         ],
                         placeholder="Select base currency",
+                        clearable=False,
                     )
                 ],
             ),
@@ -255,7 +290,11 @@ price_page = [
                         id="loading-price-graph",
                         type="default",
                         fullscreen=False,
-                        children=[dcc.Graph(id="price-graph")],
+                        children=[
+                            dcc.Graph(id="price-graph"),
+                            # Stash token the figure was built from
+                            dcc.Store(id="price-graph-token"),
+                        ],
                     ),
                 ],
                 className="page-1-graph-card",
@@ -302,7 +341,11 @@ trend_page = [
                         id="loading-trend-graph",
                         type="default",
                         fullscreen=False,
-                        children=[dcc.Graph(id="trend-graph")],
+                        children=[
+                            dcc.Graph(id="trend-graph"),
+                            # Stash token the figure was built from
+                            dcc.Store(id="trend-graph-token"),
+                        ],
                     ),
                 ],
                 className="page-1-graph-card",
@@ -385,7 +428,11 @@ ml_page = [
                         id="loading-forecast-graph",
                         type="default",
                         fullscreen=False,
-                        children=[dcc.Graph(id="forecast-graph")],
+                        children=[
+                            dcc.Graph(id="forecast-graph"),
+                            # Stash token the figure was built from
+                            dcc.Store(id="forecast-graph-token"),
+                        ],
                     ),
                 ],
                 className="page-2-graph-card",
@@ -395,6 +442,104 @@ ml_page = [
 ]
 
 
+# All symbols over the selected period
+overview_page = [
+    dbc.Row(
+        [
+            dbc.Col(
+                dbc.Card(
+                    [
+                        dbc.CardHeader(
+                            children=[
+                                html.Div("Ranking", style={"display": "inline"}),
+                                create_tooltip(
+                                    id="overview-kpi-tooltip",
+                                    tooltip_text="Symbols ranked by return over the selected period. Volatility is annualized from the returns of each candle.",
+                                ),
+                            ],
+                            className="rounded-top",
+                        ),
+                        dbc.CardBody(
+                            dcc.Loading(
+                                id="loading-overview-kpis",
+                                type="default",
+                                children=[html.Div(id="overview-kpis")],
+                            )
+                        ),
+                    ],
+                    className="kpi-div",
+                ),
+                className="first-page-col col-12 col-xl-5",
+            ),
+            dbc.Col(
+                dbc.Card(
+                    [
+                        html.H2("Correlation of returns", id="header-correlation-graph"),
+                        dcc.Loading(
+                            id="loading-correlation-graph",
+                            type="default",
+                            fullscreen=False,
+                            children=[dcc.Graph(id="correlation-graph")],
+                        ),
+                    ],
+                    className="page-3-graph-card",
+                ),
+                className="col-12 col-xl-7",
+            ),
+        ],
+    ),
+    html.Div(
+        className="page-graphs",
+        children=[
+            dbc.Card(
+                [
+                    html.H2("Returns per period", id="header-returns-graph"),
+                    dcc.Loading(
+                        id="loading-returns-graph",
+                        type="default",
+                        fullscreen=False,
+                        children=[dcc.Graph(id="returns-graph")],
+                    ),
+                ],
+                className="page-3-graph-card",
+            ),
+            dbc.Card(
+                [
+                    html.H2("Rolling correlation to BTC", id="header-rolling-graph"),
+                    dbc.Row(
+                        [
+                            dcc.RadioItems(
+                                id="rolling-metric",
+                                options=[
+                                    {"label": " Correlation", "value": "corr"},
+                                    {"label": " Beta", "value": "beta"},
+                                ],
+                                value="corr",
+                                inline=True,
+                                inputStyle={"margin-left": "15px"},
+                            ),
+                            create_tooltip(
+                                id="rolling-graph-tooltip",
+                                tooltip_text="Correlation and beta of the USD returns of each symbol to BTC, over a sliding window of a month of days, a week of hours or a day of minutes.",
+                            ),
+                        ],
+                        justify="end",
+                        className="row-custom",
+                    ),
+                    dcc.Loading(
+                        id="loading-rolling-graph",
+                        type="default",
+                        fullscreen=False,
+                        children=[dcc.Graph(id="rolling-graph")],
+                    ),
+                ],
+                className="page-3-graph-card",
+            ),
+        ],
+    ),
+]
+
+
 sidebar = html.Div(
     id="sidebar",
     children=[
@@ -468,6 +613,25 @@ sidebar = html.Div(
                     href="/page-2",
                     active="exact",
                 ),
+                dbc.NavLink(
+                    dbc.Row(
+                        [
+                            dbc.Col(
+                                html.Img(
+                                    src=app.get_asset_url(
+                                        "navigation/rank.png"
+                                    )
+                                ),
+                                width=2,
+                            ),
+                            dbc.Col("Market Overview"),
+                        ],
+                        justify="start",
+                        align="center",
+                    ),
+                    href="/page-3",
+                    active="exact",
+                ),
             ],
             vertical=True,
             pills=True,
@@ -547,7 +711,7 @@ app.layout = html.Div(
         # Stashed components
         html.Div(
             children=[
-                # df holds jsonified ohlc df
+                # df holds the stash token of the cached ohlc df
                 dcc.Loading(
                     id="loading-1",
                     type="default",
@@ -573,6 +737,8 @@ app.layout = html.Div(
                     id="submit-range-nclick-holder", style={"display": "none"},
                 ),
                 dcc.Store(id="submit-clicks", storage_type="local"),
+                # Browser width, sets the point budget of the figures
+                dcc.Store(id="graph-width"),
             ]
         ),
     ],
@@ -588,11 +754,6 @@ app.layout = html.Div(
     [Input("url", "pathname")],
 )
 def render_page_content(pathname):
-
-    page_message = html.H1(
-        "Error", className="text-danger"
-    )
-
     if pathname == "/":
         return [price_page, {}, True]
     elif pathname == "/page-1":
@@ -600,7 +761,7 @@ def render_page_content(pathname):
     elif pathname == "/page-2":
         return [ml_page, {}, True]
     elif pathname == "/page-3":
-        return [page_message, {}, True]
+        return [overview_page, {}, True]
     else:
         # If the user tries to reach a different page, return a 404 message
         return [
@@ -616,7 +777,27 @@ def render_page_content(pathname):
         ]
 
 
+app.clientside_callback(
+    "function(pathname) { return window.innerWidth; }",
+    Output("graph-width", "data"),
+    Input("url", "pathname"),
+)
+
+
 # Create and stash dfs upon submit / page change
+def ohlc_stash_token(target, base, res):
+    """
+    Token of the candles of target quoted in base, at the requested
+    resolution if both the target and the base have it
+    """
+    from app_crossrate import CROSS_BASES, cross_kind
+
+    resolution = pick_resolution(target, res)
+    if base in CROSS_BASES:
+        resolution = pick_resolution(base, resolution)
+    return make_stash_token(target, cross_kind(base), resolution)
+
+
 @app.callback(
     [
         Output("df-ohlc-stash", "children"),
@@ -632,6 +813,7 @@ def render_page_content(pathname):
         State("df-pred-stash", "children"),
     ],
 )
+@timed_callback("generate_stash_dfs")
 def generate_stash_dfs(
     n_clicks, pathname, target, base, res, df_ohlc_stash, df_pred_stash
 ):
@@ -640,50 +822,40 @@ def generate_stash_dfs(
     # Triggered by new symbol request
     if triggered_by == "submit-button":
 
-        # User viewing price or trend page
-        if pathname == "/" or pathname == "/page-1" :
-            df_ohlc = pd.read_csv(f"data/{target}_OHLC.csv")
-
-            df_ohlc_json = df_ohlc.to_json(date_format="iso", orient="split")
-    
-            return [df_ohlc_json, df_ohlc_json]
+        # User viewing price, trend or overview page
+        if pathname in OHLC_PAGES:
+            ohlc_token = ohlc_stash_token(target, base, res)
+            return [ohlc_token, ohlc_token]
         
         # User viewing ml page
         elif pathname == "/page-2":
-            df_pred = pd.read_csv(f"data/pred/{target}_PRED.csv")
-            df_pred_json = df_pred.to_json(date_format="iso", orient="split")
-            return [df_pred_json, df_pred_json]
+            pred_token = make_stash_token(target, "pred")
+            return [pred_token, pred_token]
 
 
     # Triggered by page navigation
     else:
-        # User viewing price or trend page and stash is empty
-        if (
-            pathname == "/" or pathname == "/page-1"   
-        ) and df_ohlc_stash is None:
-
-            df_ohlc = pd.read_csv("data/BTC_OHLC.csv")
-            df_ohlc_json = df_ohlc.to_json(date_format="iso", orient="split")
-        
+        # User viewing price, trend or overview page and stash is empty
+        if pathname in OHLC_PAGES and df_ohlc_stash is None:
 
+            ohlc_token = ohlc_stash_token("BTC", base, res)
             return [
-                df_ohlc_json,
-                df_ohlc_json,
+                ohlc_token,
+                ohlc_token,
             ]
         
         # User viewing ml page and stash is empty
         elif pathname == "/page-2" and df_ohlc_stash is None:
-            df_pred = pd.read_csv("data/pred/BTC_pred.csv")
-            df_pred_json = df_pred.to_json(date_format="iso", orient="split")
+            pred_token = make_stash_token("BTC", "pred")
             return [
-                df_pred_json,
-                df_pred_json,
+                pred_token,
+                pred_token,
             ]
 
 
         # All stashes are full prevent update
         else:
-            if pathname == "/" or pathname == "/page-1":
+            if pathname in OHLC_PAGES:
                 return [
                     df_ohlc_stash,
                     df_ohlc_stash,
@@ -707,16 +879,12 @@ def generate_stash_dfs(
     ],
     state=[State("base-selector", "value")],
 )
-def render_price_kpis(jsonified_df, slider_range, base):
-    df = pd.read_json(jsonified_df, orient="split")
-
-    if slider_range is not None:
-        smin, smax = slider_range.split("|")
-        smin = int(smin)
-        smax = int(smax)
-        df = df.loc[smin:smax, :]
-    else:
-        df = df.loc[len(df) - 1 - initial_limit : len(df) - 1].copy()
+@timed_callback("render_price_kpis")
+def render_price_kpis(stash_token, slider_range, base):
+    if slider_range is None:
+        dates = stash_dates(stash_token)
+        slider_range = format_range(months_back(dates, INITIAL_MONTHS), dates[-1])
+    df = load_stash_frame(stash_token, slider_range)
 
     if base == "USD":
         base_symbol = "$"
@@ -726,9 +894,11 @@ def render_price_kpis(jsonified_df, slider_range, base):
             round_digits = 2
             last_price = "{:.2f}".format(df["close"].iloc[-1])
 
-    elif base == "ETH":
-        base_symbol = "ETH"
-        last_price = np.format_float_positional(df["close"].iloc[-1])
+    else:
+        base_symbol = base
+        last_price = np.format_float_positional(
+            df["close"].iloc[-1], precision=8, unique=False, fractional=False, trim="-"
+        )
 
     perc_24h = calculate_perc_vs_previous_date(df, "close")
 
@@ -892,6 +1062,8 @@ def show_hide_date_slider(oneM, threeM, sixM, oneY, threeY, ALL, CUSTOM):
         Output("my-range-slider", "max"),
         Output("my-range-slider", "min"),
         Output("my-range-slider", "value"),
+        Output("my-range-slider", "step"),
+        Output("my-range-slider", "marks"),
     ],
     inputs=[
         Input("df-main-stash", "children"),
@@ -915,9 +1087,10 @@ def show_hide_date_slider(oneM, threeM, sixM, oneY, threeY, ALL, CUSTOM):
         State("CUSTOM", "active"),
     ],
 )
+@timed_callback("slider_send_update")
 def slider_send_update(
     # n_clicks,
-    jsonified_df,
+    stash_token,
     submit_range_clicks,
     oneM,
     threeM,
@@ -926,7 +1099,7 @@ def slider_send_update(
     threeY,
     ALL,
     range_slider_value,
-    # jsonified_df,
+    # stash_token,
     previous_submit_range_clicks,
     period_min_max,
     M1_selector_active,
@@ -954,20 +1127,21 @@ def slider_send_update(
     ]
     is_any_quick_selector_active = any(quick_selector_list)
 
+    # Ranges are "start|end" epoch seconds, quick selectors go back calendar
+    # months from the last candle
+    dates = stash_dates(stash_token)
+    resolution = parse_stash_token(stash_token)[2]
+    date_format = DATE_FORMATS[resolution]
+    # The slider moves one candle at a time
+    step = RESOLUTION_NS[resolution] // 10**9
+
     # Opening
     if button_id == "df-main-stash" and not is_any_quick_selector_active:
-        df = pd.read_json(jsonified_df, orient="split")
+        min_limit = to_seconds(months_back(dates, INITIAL_MONTHS))
+        max_limit = to_seconds(dates[-1])
 
-        max_limit = len(df) - 1
-        if max_limit - initial_limit > 0:
-            min_limit = max_limit - initial_limit
-        else:
-            min_limit = 0
-
-        date_end = df.loc[len(df) - 1, "Date"].strftime("%b %d, %Y")
-        date_start = df.loc[len(df) - 1 - initial_limit, "Date"].strftime(
-            "%b %d, %Y"
-        )
+        date_end = format_date(dates[-1], date_format)
+        date_start = format_date(months_back(dates, INITIAL_MONTHS), date_format)
         date_string = str(date_start) + " - " + str(date_end)
 
         return [
@@ -978,35 +1152,22 @@ def slider_send_update(
             max_limit,
             min_limit,
             [min_limit, max_limit],
+            step,
+            slider_marks(min_limit, max_limit, date_format),
         ]
 
     elif button_id == "submit-range-button" or CUSTOM_selector_active:
-        df = pd.read_json(jsonified_df, orient="split")
-        is_daily = int(pd.to_datetime(df.Date).dt.strftime("%H").sum()) == 0
-        if is_daily:
-            date_start = pd.to_datetime(df.Date).dt.strftime("%b %d, %Y")[
-                range_slider_value[0]
-            ]
-            date_end = pd.to_datetime(df.Date).dt.strftime("%b %d, %Y")[
-                range_slider_value[1]
-            ]
-            date_string = str(date_start) + " - " + str(date_end)
-        else:
-            date_start = pd.to_datetime(df.Date).dt.strftime("%b %d, %H:%M")[
-                range_slider_value[0]
-            ]
-            date_end = pd.to_datetime(df.Date).dt.strftime("%b %d, %H:%M")[
-                range_slider_value[1]
-            ]
-            date_string = str(date_start) + " - " + str(date_end)
+        date_start = format_date(np.datetime64(range_slider_value[0], "s"), date_format)
+        date_end = format_date(np.datetime64(range_slider_value[1], "s"), date_format)
+        date_string = str(date_start) + " - " + str(date_end)
 
         # for opening
         if period_min_max is None:
-            range_max = initial_limit
-            range_min = 0
+            range_max = to_seconds(dates[-1])
+            range_min = to_seconds(months_back(dates, INITIAL_MONTHS))
         # retrieve from buttons
         else:
-            range_min, range_max = period_min_max.split("|")
+            range_min, range_max = parse_range(period_min_max)
 
         return [
             str(range_slider_value[0]) + "|" + str(range_slider_value[1]),
@@ -1016,58 +1177,24 @@ def slider_send_update(
             int(range_max),
             int(range_min),
             [range_slider_value[0], range_slider_value[1]],
+            step,
+            slider_marks(range_min, range_max, date_format),
         ]
     # Triggered by quick period selectors
     else:
-        df = pd.read_json(jsonified_df, orient="split")
-        if button_id == "1M":
-            period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -1)
-
-        elif button_id == "3M":
-            period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -3)
-
-        elif button_id == "6M":
-            period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -6)
-
-        elif button_id == "1Y":
-            period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -12)
-
-        elif button_id == "3Y":
-            period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -36)
-
-        elif button_id == "ALL":
-            period_look_back = 9999999
-
-        period_max = len(df) - 1
-        print("button id = ", button_id)
-
-        # Find out active button
         if button_id == "df-main-stash":
             # Get which selector is active
             true_idx = [i for i, x in enumerate(quick_selector_list) if x][0]
-            if true_idx == 0:
-                period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -1)
-
-            elif true_idx == 1:
-                period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -6)
-
-            elif true_idx == 2:
-                period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -12)
-
-            elif true_idx == 3:
-                period_look_back = monthdelta(df.loc[len(df) - 1, "Date"], -36)
-
-            elif true_idx == 4:
-                period_look_back = 9999999
-
-        if period_look_back <= period_max:
-            period_min = period_max - period_look_back
+            months = [1, 6, 12, 36, None][true_idx]
         else:
-            period_min = 0
+            months = QUICK_SELECTOR_MONTHS[button_id]
+
+        period_min = to_seconds(months_back(dates, months))
+        period_max = to_seconds(dates[-1])
 
-        date_start = df.loc[period_min, "Date"].strftime("%b %d, %Y")
+        date_start = format_date(months_back(dates, months), date_format)
 
-        date_end = df.loc[period_max, "Date"].strftime("%b %d, %Y")
+        date_end = format_date(dates[-1], date_format)
 
         date_string = str(date_start) + " - " + str(date_end)
 
@@ -1079,97 +1206,120 @@ def slider_send_update(
             int(period_max),
             int(period_min),
             [int(period_min), int(period_max)],
+            step,
+            slider_marks(period_min, period_max, date_format),
         ]
 
 
 # Generate trend plot (MACD)
 @app.callback(
-    Output("trend-graph", "figure"),
+    [
+        Output("trend-graph", "figure"),
+        Output("trend-graph-token", "data"),
+    ],
     inputs=[Input("range-min-max", "children")],
     state=[
         State("df-ohlc-stash", "children"),
         State("target-selector", "value"),
         State("base-selector", "value"),
+        State("graph-width", "data"),
+        State("trend-graph-token", "data"),
     ],
 )
+@timed_callback("generate_trend_plot")
 def generate_trend_plot(
-    slider_range, jsonified_df, target, base,
+    slider_range, stash_token, target, base, graph_width, shown_token,
 ):
     """
     Triggers either by range selector or social. When new symbol requested,
-    slider_send_update handles request then triggers this callback
+    slider_send_update handles request then triggers this callback.
+    Range changes on the same symbol only patch the traces
     """
 
-    df = pd.read_json(jsonified_df, orient="split")
+    df = load_stash_frame(stash_token, slider_range)
 
-    if slider_range is not None:
-        smin, smax = slider_range.split("|")
-        smin = int(smin)
-        smax = int(smax)
-        df = df.loc[smin:smax, :]
-
-    figure_trend = generate_macd_plot(df, base, target)
+    figure_trend = generate_macd_plot(
+        df, base, target, max_points=max_points_for_width(graph_width)
+    )
 
-    return figure_trend
+    return [figure_update(figure_trend, stash_token, shown_token), stash_token]
 
 # Generate price plot
 @app.callback(
-    Output("price-graph", "figure"),
+    [
+        Output("price-graph", "figure"),
+        Output("price-graph-token", "data"),
+    ],
     inputs=[Input("range-min-max", "children")],
     state=[
         State("df-ohlc-stash", "children"),
         State("target-selector", "value"),
         State("base-selector", "value"),
+        State("graph-width", "data"),
+        State("price-graph-token", "data"),
     ],
 )
+@timed_callback("generate_prices_plot")
 def generate_prices_plot(
-    slider_range, jsonified_df, target, base,
+    slider_range, stash_token, target, base, graph_width, shown_token,
 ):
     """
     Triggers either by range selector or social. When new symbol requested,
-    slider_send_update handles request then triggers this callback
+    slider_send_update handles request then triggers this callback.
+    Range changes on the same symbol only patch the traces
     """
 
-    df = pd.read_json(jsonified_df, orient="split")
+    df = load_stash_frame(stash_token, slider_range)
 
-    if slider_range is not None:
-        smin, smax = slider_range.split("|")
-        smin = int(smin)
-        smax = int(smax)
-        df = df.loc[smin:smax, :]
-
-    figure_price = generate_price_plot(df, base, target)
+    figure_price = generate_price_plot(
+        df, base, target, max_points=max_points_for_width(graph_width)
+    )
 
-    return figure_price
+    return [figure_update(figure_price, stash_token, shown_token), stash_token]
 
 
 # Generate price plot
 @app.callback(
-    Output("forecast-graph", "figure"),
+    [
+        Output("forecast-graph", "figure"),
+        Output("forecast-graph-token", "data"),
+    ],
     inputs=[Input("range-min-max", "children")],
     state=[
         State("df-ohlc-stash", "children"),
         State("target-selector", "value"),
         State("base-selector", "value"),
+        State("graph-width", "data"),
+        State("forecast-graph-token", "data"),
     ],
 )
+@timed_callback("generate_forecast_plot")
 def generate_forecast_plot(
-    slider_range, jsonified_df, target, base,
+    slider_range, stash_token, target, base, graph_width, shown_token,
 ):
     """
     Triggers either by range selector or social. When new symbol requested,
-    slider_send_update handles request then triggers this callback
+    slider_send_update handles request then triggers this callback.
+    Range changes on the same symbol only patch the traces
     """
+    # Clustering is only needed on the ML page, imported on first use
+    from app_kmeans_levels import level_cache
 
-    if slider_range is not None:
-        smin, smax = slider_range.split("|")
-        smin = int(smin)
-        smax = int(smax)
-        df = df.loc[smin:smax, :]
+    df = load_stash_frame(stash_token, slider_range)
 
-    figure_forecast = generate_ml_plot(df, base, target)
+    figure_forecast = generate_ml_plot(
+        df,
+        base,
+        target,
+        max_points=max_points_for_width(graph_width),
+        levels=level_cache.get(stash_token, df),
+    )
 
-    return figure_forecast
+    # Levels are clustered on the selected window, the patch carries them
+    return [
+        figure_update(figure_forecast, stash_token, shown_token, layout_keys=("shapes",)),
+        stash_token,
+    ]
 
 
 # Generate price plot
@@ -1182,26 +1332,86 @@ def generate_forecast_plot(
         State("base-selector", "value"),
     ],
 )
+@timed_callback("generate_volume_plot")
 def generate_volume_plot(
-    slider_range, jsonified_df, target, base,
+    slider_range, stash_token, target, base,
 ):
     """
     Triggers either by range selector or social. When new symbol requested,
     slider_send_update handles request then triggers this callback
     """
 
-    df = pd.read_json(jsonified_df, orient="split")
+    df = load_stash_frame(stash_token, slider_range)
 
-    if slider_range is not None:
-        smin, smax = slider_range.split("|")
-        smin = int(smin)
-        smax = int(smax)
-        df = df.loc[smin:smax, :]
-
-    figure_volume = generate_volume_plot(df, base, target)
+    figure_volume = generate_volume_bars(df, base, target)
 
     return figure_volume
 
+# Market overview page
+@app.callback(
+    [
+        Output("overview-kpis", "children"),
+        Output("correlation-graph", "figure"),
+        Output("returns-graph", "figure"),
+    ],
+    inputs=[Input("range-min-max", "children")],
+    state=[
+        State("df-ohlc-stash", "children"),
+        State("base-selector", "value"),
+    ],
+)
+@timed_callback("render_overview")
+def render_overview(slider_range, stash_token, base):
+    """
+    Every symbol at the resolution and over the period of the stash, the
+    close matrix is only rebuilt when one of the symbols gets new candles
+    """
+    if slider_range is None:
+        dates = stash_dates(stash_token)
+        slider_range = format_range(months_back(dates, INITIAL_MONTHS), dates[-1])
+    start, end = parse_range(slider_range)
+    resolution = parse_stash_token(stash_token)[2]
+
+    # The overview modules are only imported by the workers serving the page
+    from app_overview import market_overview
+
+    overview = market_overview.get(base, resolution, start, end)
+
+    return [
+        create_kpi_table(overview["kpis"], base),
+        generate_correlation_plot(overview["correlation"]),
+        generate_returns_heatmap(overview["returns"]),
+    ]
+
+
+# Rolling correlation panel of the overview page
+@app.callback(
+    Output("rolling-graph", "figure"),
+    inputs=[
+        Input("range-min-max", "children"),
+        Input("rolling-metric", "value"),
+    ],
+    state=[
+        State("df-ohlc-stash", "children"),
+        State("graph-width", "data"),
+    ],
+)
+@timed_callback("render_rolling_correlation")
+def render_rolling_correlation(slider_range, metric, stash_token, graph_width):
+    if slider_range is None:
+        dates = stash_dates(stash_token)
+        slider_range = format_range(months_back(dates, INITIAL_MONTHS), dates[-1])
+    start, end = parse_range(slider_range)
+    resolution = parse_stash_token(stash_token)[2]
+
+    from app_correlation import REFERENCE, correlation_engine
+
+    rolling = correlation_engine.series(
+        resolution, start, end, points=max_points_for_width(graph_width)
+    )
+
+    return generate_rolling_plot(rolling[metric], REFERENCE)
+
+
 if __name__ == "__main__":
     app.run_server(debug=False, dev_tools_hot_reload=True)
-    
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app_metrics import timed_stage
+from app_store import RESOLUTION, csv_backed, load_frame, store_path
+
+
+DATA_DIR = "data"
+
+# Number of parsed frames kept in memory per worker
+MAX_FRAMES = 32
+
+
+def frame_path(symbol, kind="ohlc", resolution=RESOLUTION):
+    """
+    Source file backing a cached frame: the csv, or the store meta.json of
+    resolutions without csv
+    """
+    if kind == "pred":
+        return os.path.join(DATA_DIR, "pred", "{}_PRED.csv".format(symbol))
+    if csv_backed(symbol, resolution, DATA_DIR):
+        return os.path.join(DATA_DIR, "{}_OHLC.csv".format(symbol))
+    return os.path.join(store_path(symbol, resolution, os.path.join(DATA_DIR, "store")), "meta.json")
+
+
+def read_frame(symbol, kind="ohlc", resolution=RESOLUTION):
+    """
+    Load a symbol, ohlc history comes from the memory mapped binary store
+    """
+    if kind == "ohlc":
+        return load_frame(symbol, DATA_DIR, resolution=resolution)
+    return pd.read_csv(frame_path(symbol, kind), parse_dates=["Date"])
+
+
+def combine_versions(*versions):
+    """
+    Version of a frame derived from several sources: an int that changes
+    when any of them changes (a max would miss one source going back, or
+    an older source being replaced)
+    """
+    key = ":".join(str(v) for v in versions).encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") >> 1
+
+
+class FrameCache:
+    """
+    Process level LRU cache of parsed frames keyed by (kind, symbol, resolution).
+    Entries are invalidated when the mtime of the source csv changes.
+    Frames registered with put have no source file and are never evicted.
+    register_kind plugs another loader and version function for a kind,
+    defer_kinds delays the registration to the first request of a kind.
+    """
+
+    def __init__(self, max_frames=MAX_FRAMES, loader=read_frame):
+        self.max_frames = max_frames
+        self.loader = loader
+        self._frames = OrderedDict()
+        self._pinned = {}
+        self._kinds = {}
+        self._deferred = []
+        self._lock = threading.Lock()
+        self._register_lock = threading.Lock()
+
+    def register_kind(self, kind, loader, version):
+        """
+        loader(symbol, kind, resolution) builds the frame,
+        version(symbol, resolution) is an int that changes whenever the
+        frame would change
+        """
+        self._kinds[kind] = (loader, version)
+
+    def defer_kinds(self, register):
+        """
+        register(frame_cache) is called on the first request of a kind
+        that is not registered, so the modules serving extra kinds are
+        only imported by the workers that use them
+        """
+        self._deferred.append(register)
+
+    def _kind(self, kind):
+        if kind != "ohlc" and kind not in self._kinds and self._deferred:
+            with self._register_lock:
+                while kind not in self._kinds and self._deferred:
+                    # Dropped once done, other threads wait on the lock meanwhile
+                    self._deferred[0](self)
+                    self._deferred.pop(0)
+        return self._kinds.get(kind)
+
+    def version(self, symbol, kind="ohlc", resolution=RESOLUTION):
+        registered = self._kind(kind)
+        if registered is not None:
+            return registered[1](symbol, resolution)
+        return os.stat(frame_path(symbol, kind, resolution)).st_mtime_ns
+
+    def put(self, symbol, df, kind="ohlc", version=0, resolution=RESOLUTION):
+        """
+        Register an in-memory frame (synthetic histories, derived series)
+        """
+        with self._lock:
+            self._pinned[(kind, symbol, resolution)] = (df, version)
+
+    def get(self, symbol, kind="ohlc", resolution=RESOLUTION):
+        """
+        Returns (df, version) for a symbol, reloading it if the source changed
+        """
+        key = (kind, symbol, resolution)
+        if key in self._pinned:
+            return self._pinned[key]
+        version = self.version(symbol, kind, resolution)
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None and entry[1] == version:
+                self._frames.move_to_end(key)
+                return entry
+
+        registered = self._kind(kind)
+        if registered is not None:
+            df = registered[0](symbol, kind, resolution)
+        else:
+            df = self.loader(symbol, kind, resolution)
+
+        with self._lock:
+            self._frames[key] = (df, version)
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return df, version
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._pinned.clear()
+
+
+frame_cache = FrameCache()
+
+
+def make_stash_token(symbol, kind="ohlc", resolution=RESOLUTION):
+    """
+    Small token stored in the hidden stash divs instead of the jsonified df.
+    Carries the source version so dependent callbacks refire on new data.
+    """
+    _, version = frame_cache.get(symbol, kind, resolution)
+    return "{}|{}|{}|{}".format(kind, symbol, resolution, version)
+
+
+def parse_stash_token(token):
+    kind, symbol, resolution, version = token.split("|")
+    return kind, symbol, resolution, int(version)
+
+
+def to_seconds(date):
+    """
+    Epoch seconds of a date, the unit of the range-min-max timestamps
+    """
+    return int(pd.Timestamp(date).value // 10**9)
+
+
+def format_range(start, end):
+    return "{}|{}".format(to_seconds(start), to_seconds(end))
+
+
+def parse_range(date_range):
+    start, end = date_range.split("|")
+    return int(start), int(end)
+
+
+def date_slice(df, start=None, end=None):
+    """
+    Rows of a Date sorted df with start <= Date <= end (epoch seconds, None
+    for an open end), located by binary search on the timestamps
+    """
+    dates = df["Date"].values
+    i = 0 if start is None else np.searchsorted(dates, np.datetime64(start, "s"), "left")
+    j = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, "s"), "right")
+    return df.iloc[i:j]
+
+
+@timed_stage("frame_load")
+def query(symbol, start=None, end=None, resolution=RESOLUTION, kind="ohlc"):
+    """
+    Copy of the rows of a symbol between start and end (epoch seconds,
+    inclusive). O(log n) plus the size of the result.
+    """
+    df, _ = frame_cache.get(symbol, kind, resolution)
+    return date_slice(df, start, end).copy()
+
+
+def load_stash_frame(token, date_range=None):
+    """
+    Rows of the frame referenced by a stash token, within the "start|end"
+    timestamps when given
+    """
+    kind, symbol, resolution, _ = parse_stash_token(token)
+    start, end = parse_range(date_range) if date_range is not None else (None, None)
+    return query(symbol, start, end, resolution, kind)
+
+
+def stash_dates(token):
+    """
+    Date column of the frame behind a stash token, not copied
+    """
+    kind, symbol, resolution, _ = parse_stash_token(token)
+    df, _ = frame_cache.get(symbol, kind, resolution)
+    return df["Date"].values
@@ -0,0 +1,283 @@
+# Rolling correlation, covariance and beta to BTC across all the symbols
+#
+#   python app_correlation.py                                # latest daily window
+#   python app_correlation.py --resolution 1h --window 168
+#   python app_correlation.py --output betas.csv --points 500
+#
+# Window statistics are pairwise complete (like pandas corr): a pair only
+# uses the candles where both symbols have a return. They all derive from
+# four sums per pair, which windows can add and remove rows from:
+#     n    candles where both i and j have a return
+#     sx   sum of the returns of i on these candles
+#     sxx  sum of the squared returns of i on these candles
+#     sxy  sum of the return products
+import argparse
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from app_downsample import MAX_POINTS
+from app_metrics import timed_stage
+from app_overview import market_overview
+from app_store import RESOLUTION, RESOLUTIONS
+
+
+# Betas are measured against this symbol
+REFERENCE = "BTC"
+
+# Default window of each resolution: a month of days, a week of hours,
+# a day of minutes
+ROLLING_WINDOWS = {"1m": 1440, "1h": 168, "1d": 30}
+
+# Share of the window a pair needs in common for its statistics
+MIN_PERIODS = 0.5
+
+# Boundaries further apart than this on average are summed with one matrix
+# product per segment. Closer ones (about a window per row) come from the
+# cumulative sums of the per row outer products, PREFIX_CHUNK_ROWS rows at
+# a time.
+SEGMENT_ROWS = 2
+PREFIX_CHUNK_ROWS = 1024
+
+# The online sums are recomputed exactly every RESYNC_WINDOWS windows, so
+# the rounding of the add / remove updates cannot drift
+RESYNC_WINDOWS = 10
+
+
+def log_returns(matrix):
+    """
+    Dates and log returns of a close matrix (rows x symbols), NaN where a
+    candle or the previous one is missing
+    """
+    close = matrix.to_numpy(dtype=float)
+    return matrix.index.values[1:], np.diff(np.log(close), axis=0)
+
+
+def window_sums(returns):
+    """
+    The (4, k, k) sums n, sx, sxx, sxy of a block of return rows, as one
+    matrix product (sums of outer products of the rows)
+    """
+    k = returns.shape[1]
+    present = ~np.isnan(returns)
+    m = present.astype(float)
+    x = np.where(present, returns, 0.0)
+    products = np.hstack([m, x, x * x]).T @ np.hstack([m, x])
+    return np.stack([products[:k, :k], products[k : 2 * k, :k], products[2 * k :, :k], products[k : 2 * k, k:]])
+
+
+def window_stats(sums, min_periods=2):
+    """
+    Covariance, correlation and variance matrices from window sums, over
+    any leading axes. var[..., i, j] is the variance of i on the candles
+    shared with j.
+    """
+    n, sx, sxx, sxy = (sums[..., c, :, :] for c in range(4))
+    sy = np.swapaxes(sx, -1, -2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = np.where(n >= max(min_periods, 2), n, np.nan)
+        cov = (sxy - sx * sy / n) / (n - 1)
+        var = (sxx - sx * sx / n) / (n - 1)
+        corr = cov / np.sqrt(var * np.swapaxes(var, -1, -2))
+    return {"cov": cov, "corr": np.clip(corr, -1, 1), "var": var}
+
+
+def betas(stats, reference):
+    """
+    Beta of every symbol to the reference column: cov(i, ref) / var(ref)
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return stats["cov"][..., :, reference] / stats["var"][..., reference, :]
+
+
+def prefix_sums(returns, bounds, chunk_rows=PREFIX_CHUNK_ROWS):
+    """
+    Sums of the rows before each of the sorted bounds. Short segments
+    between bounds come from the cumulative sums of the per row outer
+    products (computed chunk by chunk), long ones from one matrix product
+    each.
+    """
+    k = returns.shape[1]
+    prefix = np.zeros((len(bounds), 4, k, k))
+    if len(bounds) < 2:
+        return prefix
+
+    if (bounds[-1] - bounds[0]) / (len(bounds) - 1) >= SEGMENT_ROWS:
+        for i in range(1, len(bounds)):
+            prefix[i] = prefix[i - 1] + window_sums(returns[bounds[i - 1] : bounds[i]])
+        return prefix
+
+    carry = np.zeros((4, k, k))
+    outer = np.empty((min(chunk_rows, bounds[-1] - bounds[0]), 4, k, k))
+    for a in range(bounds[0], bounds[-1], chunk_rows):
+        b = min(a + chunk_rows, bounds[-1])
+        present = ~np.isnan(returns[a:b])
+        m = present.astype(float)
+        x = np.where(present, returns[a:b], 0.0)
+        rows = outer[: b - a]
+        np.multiply(m[:, :, None], m[:, None, :], out=rows[:, 0])
+        np.multiply(x[:, :, None], m[:, None, :], out=rows[:, 1])
+        np.multiply((x * x)[:, :, None], m[:, None, :], out=rows[:, 2])
+        np.multiply(x[:, :, None], x[:, None, :], out=rows[:, 3])
+        cumulative = np.cumsum(rows, axis=0, out=rows)
+        cumulative += carry
+        inside = (bounds > a) & (bounds <= b)
+        prefix[inside] = cumulative[bounds[inside] - a - 1]
+        carry = cumulative[-1].copy()
+    return prefix
+
+
+def rolling_sums(returns, window, ends):
+    """
+    Sums of the windows of rows ends - window .. ends (ends excluded), as
+    differences of prefix sums taken only at the window boundaries
+    """
+    ends = np.asarray(ends)
+    starts = np.maximum(ends - window, 0)
+    bounds = np.unique(np.concatenate([[0], starts, ends]))
+    prefix = prefix_sums(returns, bounds)
+    return prefix[np.searchsorted(bounds, ends)] - prefix[np.searchsorted(bounds, starts)]
+
+
+class RollingMoments:
+    """
+    Window sums of the last window return rows, updated online: a new row
+    adds its outer products and the row leaving the window removes them
+    """
+
+    def __init__(self, n_symbols, window):
+        self.window = window
+        self.rows = deque()
+        self.sums = np.zeros((4, n_symbols, n_symbols))
+        self._updates = 0
+
+    @classmethod
+    def from_rows(cls, returns, window):
+        moments = cls(returns.shape[1], window)
+        moments.rows.extend(returns[-window:])
+        moments.sums = window_sums(returns[-window:])
+        return moments
+
+    def push(self, row):
+        row = np.asarray(row, dtype=float)
+        self.rows.append(row)
+        self.sums += window_sums(row[None])
+        if len(self.rows) > self.window:
+            self.sums -= window_sums(self.rows.popleft()[None])
+
+        self._updates += 1
+        if self._updates >= RESYNC_WINDOWS * self.window:
+            self.sums = window_sums(np.array(self.rows))
+            self._updates = 0
+
+    def stats(self, extra=None, min_periods=2):
+        """
+        Window statistics, extra rows (not yet closed candles) are added on
+        top of the window without being kept
+        """
+        sums = self.sums if extra is None else self.sums + window_sums(extra)
+        return window_stats(sums, min_periods)
+
+
+class CorrelationEngine:
+    """
+    Rolling statistics of the USD returns of every symbol, on the close
+    matrices of a MarketOverview. series() samples the windows ending over
+    a period in one batch, latest() keeps the last window of each
+    (resolution, window) up to date online as candles are appended.
+    """
+
+    def __init__(self, market_overview, reference=REFERENCE):
+        self.market_overview = market_overview
+        self.reference = reference
+        self._online = {}
+        self._lock = threading.Lock()
+
+    def matrix(self, resolution):
+        versions = self.market_overview.versions("USD", resolution)
+        return self.market_overview.matrix("USD", resolution, versions)
+
+    @timed_stage("rolling_correlation")
+    def series(self, resolution=RESOLUTION, start=None, end=None, window=None, points=MAX_POINTS):
+        """
+        Correlation and beta to the reference of every symbol for at most
+        points windows ending between start and end (epoch seconds), as
+        frames indexed by the window end
+        """
+        window = window or ROLLING_WINDOWS[resolution]
+        matrix = self.matrix(resolution)
+        dates, returns = log_returns(matrix)
+        i = 0 if start is None else np.searchsorted(dates, np.datetime64(start, "s"), "left")
+        j = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, "s"), "right")
+        ends = np.unique(np.linspace(i, j, min(points, j - i) + 1).astype(int)[1:])
+
+        stats = window_stats(rolling_sums(returns, window, ends), int(window * MIN_PERIODS))
+        reference = list(matrix.columns).index(self.reference)
+        index = pd.DatetimeIndex(dates[ends - 1], name="Date")
+        return {
+            "corr": pd.DataFrame(stats["corr"][:, :, reference], index=index, columns=matrix.columns),
+            "beta": pd.DataFrame(betas(stats, reference), index=index, columns=matrix.columns),
+        }
+
+    def latest(self, resolution=RESOLUTION, window=None):
+        """
+        Covariance, correlation and beta frames of the last window. The
+        last candle may still be open, it is added on top of the closed
+        ones kept in the online sums.
+        """
+        window = window or ROLLING_WINDOWS[resolution]
+        matrix = self.matrix(resolution)
+        dates, returns = log_returns(matrix)
+        columns = list(matrix.columns)
+
+        with self._lock:
+            key = (resolution, window)
+            state = self._online.get(key)
+            position = -1
+            if state is not None and state["columns"] == columns:
+                position = np.searchsorted(dates, state["date"])
+                if position >= len(dates) or dates[position] != state["date"]:
+                    position = -1
+
+            closed = len(returns) - 1
+            if position < 0:
+                moments = RollingMoments.from_rows(returns[:closed], window - 1)
+            else:
+                moments = state["moments"]
+                for row in returns[position + 1 : closed]:
+                    moments.push(row)
+            if closed > 0:
+                self._online[key] = {"columns": columns, "date": dates[closed - 1], "moments": moments}
+
+        stats = moments.stats(returns[closed:], int(window * MIN_PERIODS))
+        reference = columns.index(self.reference)
+        return {
+            "cov": pd.DataFrame(stats["cov"], index=columns, columns=columns),
+            "corr": pd.DataFrame(stats["corr"], index=columns, columns=columns),
+            "beta": pd.Series(betas(stats, reference), index=columns, name="beta"),
+        }
+
+
+correlation_engine = CorrelationEngine(market_overview)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Rolling correlation, covariance and beta to BTC of every symbol")
+    parser.add_argument("--resolution", default=RESOLUTION, choices=RESOLUTIONS)
+    parser.add_argument("--window", type=int, help="candles per window, default by resolution")
+    parser.add_argument("--points", type=int, default=MAX_POINTS, help="windows sampled for --output")
+    parser.add_argument("--output", help="write the rolling betas to this csv")
+    args = parser.parse_args()
+
+    window = args.window or ROLLING_WINDOWS[args.resolution]
+    latest = correlation_engine.latest(args.resolution, window)
+
+    print("[INFO]: last {} candles of {}".format(window, args.resolution))
+    print(pd.DataFrame({"beta": latest["beta"], "corr": latest["corr"][REFERENCE]}).sort_values("beta").to_string(float_format="{:.3f}".format))
+    print(latest["corr"].to_string(float_format="{:.2f}".format))
+    if args.output:
+        correlation_engine.series(args.resolution, window=window, points=args.points)["beta"].to_csv(args.output)
+        print("[INFO]: rolling betas written to " + args.output)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from app_cache import combine_versions
+from app_metrics import timed_stage
+from app_store import RESOLUTION, with_indicators
+
+
+# Bases of the base-selector derived from the stored USDT candles, USD is
+# the stored series itself
+CROSS_BASES = ["BTC", "ETH"]
+
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+
+
+def cross_kind(base):
+    """
+    FrameCache kind of the candles of a symbol quoted in base
+    """
+    if base in CROSS_BASES:
+        return "ohlc_" + base.lower()
+    return "ohlc"
+
+
+def cross_frame(df, base_df):
+    """
+    Candles of df quoted in the asset of base_df (both USDT quoted) on the
+    timestamps present in both, with the indicators recomputed on the
+    ratio. Open and close are exact. The intra candle extremes of the pair
+    are not recoverable, high and low divide the symbol extremes by the
+    body of the base candle and are clipped to contain open and close.
+    """
+    dates, i, j = np.intersect1d(
+        df["Date"].values, base_df["Date"].values, assume_unique=True, return_indices=True
+    )
+    symbol = df[PRICE_COLUMNS].to_numpy(dtype=float)[i]
+    base = base_df[PRICE_COLUMNS].to_numpy(dtype=float)[j]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        open_ = symbol[:, 0] / base[:, 0]
+        close = symbol[:, 3] / base[:, 3]
+        high = symbol[:, 1] / np.maximum(base[:, 0], base[:, 3])
+        low = symbol[:, 2] / np.minimum(base[:, 0], base[:, 3])
+
+    cross = pd.DataFrame(
+        {
+            "Date": dates,
+            "open": open_,
+            "high": np.maximum.reduce([open_, close, high]),
+            "low": np.minimum.reduce([open_, close, low]),
+            "close": close,
+            # Traded quantity of the symbol, the same whatever the quote
+            "volume": df["volume"].to_numpy(dtype=float)[i],
+        }
+    )
+    return with_indicators(cross)
+
+
+class CrossRates:
+    """
+    Loader and version of the FrameCache kind of one base. The derived
+    frames are cached per (symbol, base, resolution) like stored ones and
+    rebuilt when the candles of the symbol or of the base change.
+    """
+
+    def __init__(self, frame_cache, base):
+        self.frame_cache = frame_cache
+        self.base = base
+
+    def version(self, symbol, resolution=RESOLUTION):
+        return combine_versions(
+            self.frame_cache.version(symbol, "ohlc", resolution),
+            self.frame_cache.version(self.base, "ohlc", resolution),
+        )
+
+    @timed_stage("crossrate")
+    def frame(self, symbol, kind=None, resolution=RESOLUTION):
+        df, _ = self.frame_cache.get(symbol, "ohlc", resolution)
+        base_df, _ = self.frame_cache.get(self.base, "ohlc", resolution)
+        return cross_frame(df, base_df)
+
+
+def register_crossrates(frame_cache, bases=CROSS_BASES):
+    """
+    Serves the candles of every symbol quoted in each base, under the
+    kinds given by cross_kind
+    """
+    for base in bases:
+        rates = CrossRates(frame_cache, base)
+        frame_cache.register_kind(cross_kind(base), rates.frame, rates.version)
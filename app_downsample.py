@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Default max points per figure, roughly one candle per pixel of a wide graph
+MAX_POINTS = int(os.environ.get("CRYPTODASH_MAX_POINTS", 600))
+
+# Columns aggregated differently from "last value of the bucket"
+FIRST_COLUMNS = ["Date", "open"]
+MAX_COLUMNS = ["high"]
+MIN_COLUMNS = ["low"]
+SUM_COLUMNS = ["volume", "quoteAssetVolume", "numberOfTrades", "takerBuyBaseVol", "takerBuyQuoteVol"]
+# Indicators drawn as bars, averaged over the bucket so its swings count
+# rather than only its last candle
+MEAN_COLUMNS = ["MACD", "MACD_Signal"]
+
+
+def max_points_for_width(width_px, points_per_px=0.5):
+    """
+    Point budget of a figure from the browser width, MAX_POINTS when unknown
+    """
+    if not width_px:
+        return MAX_POINTS
+    return max(50, int(width_px * points_per_px))
+
+
+def bucket_starts(n, n_buckets):
+    """
+    Start row of each of n_buckets contiguous buckets over n rows
+    """
+    return np.unique(np.linspace(0, n, n_buckets, endpoint=False).astype(int))
+
+
+def downsample_ohlc(df, max_points=MAX_POINTS):
+    """
+    Re-bucket an OHLC df into at most max_points rows: first open, max high,
+    min low, last close, summed volumes, mean MACD. Other columns
+    (indicators, forecasts) take the last value of the bucket.
+    """
+    n = len(df)
+    if n <= max_points:
+        return df
+
+    starts = bucket_starts(n, max_points)
+    ends = np.append(starts[1:], n) - 1
+    data = {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if col in FIRST_COLUMNS:
+            data[col] = values[starts]
+        elif col in MAX_COLUMNS:
+            data[col] = np.fmax.reduceat(values.astype(float), starts)
+        elif col in MIN_COLUMNS:
+            data[col] = np.fmin.reduceat(values.astype(float), starts)
+        elif col in SUM_COLUMNS:
+            data[col] = np.add.reduceat(np.nan_to_num(values.astype(float)), starts)
+        elif col in MEAN_COLUMNS:
+            values = values.astype(float)
+            present = np.add.reduceat(~np.isnan(values), starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                data[col] = np.add.reduceat(np.nan_to_num(values), starts) / present
+        else:
+            data[col] = values[ends]
+    return pd.DataFrame(data, columns=df.columns)
+
+
+def minmax_indices(y, max_points=MAX_POINTS):
+    """
+    Row indices keeping the min and max of each bucket of a line, so peaks
+    survive the decimation
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    size = int(np.ceil(n / (max_points // 2)))
+    n_buckets = int(np.ceil(n / size))
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    lows = np.where(np.isnan(padded), np.inf, padded).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1) + offsets
+    idx = np.unique(np.concatenate([lows, highs, [n - 1]]))
+    return idx[idx < n]
+
+
+def downsample_line(x, y, max_points=MAX_POINTS):
+    """
+    Min/max decimation of a line trace, returns (x, y)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    idx = minmax_indices(y, max_points)
+    return x[idx], y[idx]
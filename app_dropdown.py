@@ -1,11 +1,9 @@
-import pandas as pd
-import os
+from app_store import read_symbols_manifest
 
 
-# Make a list of the crypto symbols available in the ./data folder stripping the .csv extension and the "_OHLC" from the file names
-crypto_names = list(filter(lambda f: f.endswith('.csv'), os.listdir("./data")))
-crypto_names = [name.replace("_OHLC.csv", "") for name in crypto_names]
+# Crypto symbols available in the ./data folder, from the precomputed data/symbols.json manifest
+crypto_names = read_symbols_manifest()
 
 
 #make UI selector for crypto
-crypto_dict = [{"label": name, "value": name} for name in crypto_names]
\ No newline at end of file
+crypto_dict = [{"label": name, "value": name} for name in crypto_names]
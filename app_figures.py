@@ -0,0 +1,144 @@
+from functools import lru_cache
+
+from dash import Patch
+
+
+# Crosshair spikes shared by every axis
+SPIKES = dict(
+    showspikes=True,
+    spikecolor="gray",
+    spikesnap="cursor",
+    spikemode="across",
+    spikethickness=1,
+)
+
+
+@lru_cache(maxsize=None)
+def plotly_template():
+    """
+    Default plotly template as a plain dict, go.Figure would embed the same one
+    """
+    from plotly import io as pio
+
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+@lru_cache(maxsize=None)
+def base_layout(bg_color="white", showlegend=False):
+    """
+    Static layout shared by the price, trend and forecast figures, built once
+    """
+    return {
+        "template": plotly_template(),
+        "xaxis": dict(rangeslider=dict(visible=False), **SPIKES),
+        "yaxis": dict(
+            showgrid=True,
+            gridwidth=1,
+            gridcolor="#F3f3f3",
+            showticklabels=True,
+            **SPIKES,
+        ),
+        "yaxis99": dict(
+            overlaying="y",
+            showticklabels=True,
+            side="right",
+            title=dict(text="price"),
+            color="lightgray",
+            **SPIKES,
+        ),
+        "barmode": "relative",
+        "legend": dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1,
+            font=dict(size=10),
+        ),
+        "plot_bgcolor": bg_color,
+        "margin": {"b": 0, "t": 0},
+        "showlegend": showlegend,
+        "hovermode": "x unified",
+    }
+
+
+def make_figure(traces, bg_color="white", showlegend=False, **layout):
+    """
+    Figure dict from plain trace dicts on top of the cached base layout.
+    Dash serializes dicts directly, skipping graph_objs validation.
+    Extra layout keys replace (never mutate) the cached ones.
+    """
+    return {
+        "data": traces,
+        "layout": dict(base_layout(bg_color, showlegend), **layout),
+    }
+
+
+def candlestick(df, **kwargs):
+    return dict(
+        type="candlestick",
+        x=df["Date"],
+        open=df["open"],
+        high=df["high"],
+        low=df["low"],
+        close=df["close"],
+        **kwargs,
+    )
+
+
+def line(x, y, color, name, **kwargs):
+    return dict(
+        type="scatter",
+        x=x,
+        y=y,
+        mode="lines",
+        name=name,
+        line=dict(color=color),
+        **kwargs,
+    )
+
+
+def heatmap(frame, **kwargs):
+    """
+    Heatmap of a frame, index on the y axis and columns on the x axis
+    """
+    return dict(
+        type="heatmap",
+        z=frame.to_numpy().round(2),
+        x=list(frame.columns),
+        y=list(frame.index),
+        hoverongaps=False,
+        **kwargs,
+    )
+
+
+def level_line(y, color):
+    """
+    Dashed horizontal line across the plot, same as fig.add_hline
+    """
+    return dict(
+        type="line",
+        xref="x domain",
+        x0=0,
+        x1=1,
+        yref="y",
+        y0=y,
+        y1=y,
+        line=dict(color=color, width=3, dash="dash"),
+    )
+
+
+def figure_update(figure, stash_token, shown_token, layout_keys=()):
+    """
+    Full figure when the graph shows another stash (symbol change or fresh
+    page), otherwise a Patch replacing only the traces (and the layout_keys
+    that depend on the range, like the level shapes) so the template and
+    static layout are not sent again on range changes
+    """
+    if shown_token is not None and shown_token == stash_token:
+        patched = Patch()
+        patched["data"] = figure["data"]
+        for key in layout_keys:
+            patched["layout"][key] = figure["layout"][key]
+        return patched
+    return figure
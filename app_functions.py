@@ -1,97 +1,40 @@
-from plotly import graph_objs as go
 import numpy as np
 from dash import html
 import dash_bootstrap_components as dbc
 import pandas as pd
-# from app_kmeans_levels import high_centers, low_centers
+from indicators import add_bollinger
+from app_downsample import MAX_POINTS, downsample_line, downsample_ohlc
+from app_figures import candlestick, heatmap, level_line, line, make_figure
+from app_metrics import timed_stage
 
-def generate_ml_plot(df, base, target, bg_color="white", opacity=0.3):
+@timed_stage("figure_build")
+def generate_ml_plot(df, base, target, bg_color="white", opacity=0.3, max_points=MAX_POINTS, levels=None):
+
+    # Lines keep their peaks with min/max decimation, candles are re-bucketed
+    forecast_x, forecast_y = downsample_line(df["Date"], df["3"], max_points)
+    close_x, close_y = downsample_line(df["Date"], df["close"], max_points)
+    df = downsample_ohlc(df, max_points)
 
     # Creating price Chart
-    figure_forecast = go.Figure(data=[go.Candlestick(x=df['Date'],
-                name="Actual Crypto Price",
-                open=df['open'],
-                high=df['high'],
-                low=df['low'],
-                close=df['close'])])
-    
-    # figure_forecast.add_hline(y=16373.680000, line_width=3, line_dash="dash", line_color="orange", label='asd')
-    # figure_forecast.add_hline(y=17124.748750, line_width=3, line_dash="dash", line_color="orange")
-    # figure_forecast.add_hline(y=21382.656667, line_width=3, line_dash="dash", line_color="#2596be")
-    # figure_forecast.add_hline(y=20340.042000, line_width=3, line_dash="dash", line_color="#2596be")
-    # figure_forecast.add_hline(y=20877.499000, line_width=3, line_dash="dash", line_color="#2596be")
-
-    figure_forecast.add_trace(
-         go.Scatter(
-             x=df["Date"],
-             y=df['3'],
-             mode="lines",
-             name="Forecast by LSTM",
-             line=dict(color="blue"),
-         )
-     )
-
-    figure_forecast.add_trace(
-         go.Scatter(
-             x=df["Date"],
-             y=df['close'],
-             mode="lines",
-             yaxis="y99",
-             name="Actual close price",
-             line=dict(color="red"),
-         )
-     )
-
-     
-    figure_forecast.update_layout(xaxis_rangeslider_visible=False)
-
-    figure_forecast.update_layout(
-        **{
-            "yaxis99": dict(
-                overlaying="y",
-                showticklabels=True,
-                side="right",
-                title="price",
-                color="lightgray",
-            )
-        }
-    )
-    figure_forecast.update_xaxes(
-        showspikes=True,
-        spikecolor="gray",
-        spikesnap="cursor",
-        spikemode="across",
-        spikethickness=1,
-    )
+    price_candles = candlestick(df, name="Actual Crypto Price")
 
-    figure_forecast.update_yaxes(
-        showspikes=True,
-        spikecolor="gray",
-        spikesnap="cursor",
-        spikemode="across",
-        spikethickness=1,
-    )
+    line_forecast = line(forecast_x, forecast_y, "blue", "Forecast by LSTM")
 
-    figure_forecast.update_layout(
-        barmode="relative",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1,
-            font=dict(size=10),
-        ),
-        plot_bgcolor=bg_color,
-        yaxis=dict(
-            showgrid=True,
-            gridwidth=1,
-            gridcolor="#F3f3f3",
-            showticklabels=True,
-        ),
-        margin={"b": 0, "t": 0},
+    line_close = line(close_x, close_y, "red", "Actual close price", yaxis="y99")
+
+    # Support (low centers) / resistance (high centers) levels
+    shapes = []
+    if levels is not None:
+        low_centers, high_centers = levels
+        shapes = [
+            level_line(y, "orange") for y in low_centers
+        ] + [level_line(y, "#2596be") for y in high_centers]
+
+    figure_forecast = make_figure(
+        [price_candles, line_forecast, line_close],
+        bg_color=bg_color,
         showlegend=True,
-        hovermode="x unified",
+        shapes=shapes,
     )
 
     return figure_forecast
@@ -100,126 +43,41 @@ def generate_ml_plot(df, base, target, bg_color="white", opacity=0.3):
 
 
 
-def generate_price_plot(df, base, target, bg_color="white", opacity=0.3):
+@timed_stage("figure_build")
+def generate_price_plot(df, base, target, bg_color="white", opacity=0.3, max_points=MAX_POINTS):
+
+    # Bands are materialized over the full history at ingest, only compute
+    # them here for frames that do not carry them
+    if 'bol_up' not in df.columns:
+        add_bollinger(df)
+
+    df = downsample_ohlc(df, max_points)
 
     # Creating price Chart
-    figure_price = go.Figure(data=[go.Candlestick(x=df['Date'],
-                open=df['open'],
-                high=df['high'],
-                low=df['low'],
-                close=df['close'])])
-
-    def get_sma(prices, rate):
-        return prices.rolling(rate).mean()
-
-    def get_bollinger_bands(prices, rate=20):
-        sma = get_sma(prices, rate)
-        std = prices.rolling(rate).std()
-        bollinger_up = sma + std * 2 # Calculate top band
-        bollinger_down = sma - std * 2 # Calculate bottom band
-        return bollinger_up, bollinger_down
-
-    df['bol_up'] = get_bollinger_bands(df['close'])[0] 
-    df['bol_down'] = get_bollinger_bands(df['close'])[1] 
-
-    figure_price.add_trace(
-         go.Scatter(
-             x=df["Date"],
-             y=df['bol_up'],
-             mode="lines",
-             yaxis="y99",
-             name="price",
-             line=dict(color="green"),
-         )
-     )
-
-    figure_price.add_trace(
-         go.Scatter(
-             x=df["Date"],
-             y=df['bol_down'],
-             mode="lines",
-             yaxis="y99",
-             name="price",
-             line=dict(color="red"),
-         )
-     )
-
-     
-    figure_price.update_layout(xaxis_rangeslider_visible=False)
-
-    figure_price.update_layout(
-        **{
-            "yaxis99": dict(
-                overlaying="y",
-                showticklabels=True,
-                side="right",
-                title="price",
-                color="lightgray",
-            )
-        }
-    )
-    figure_price.update_xaxes(
-        showspikes=True,
-        spikecolor="gray",
-        spikesnap="cursor",
-        spikemode="across",
-        spikethickness=1,
-    )
+    price_candles = candlestick(df)
 
-    figure_price.update_yaxes(
-        showspikes=True,
-        spikecolor="gray",
-        spikesnap="cursor",
-        spikemode="across",
-        spikethickness=1,
-    )
+    line_bol_up = line(df["Date"], df["bol_up"], "green", "price", yaxis="y99")
 
-    figure_price.update_layout(
-        barmode="relative",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1,
-            font=dict(size=10),
-        ),
-        plot_bgcolor=bg_color,
-        yaxis=dict(
-            showgrid=True,
-            gridwidth=1,
-            gridcolor="#F3f3f3",
-            showticklabels=True,
-        ),
-        margin={"b": 0, "t": 0},
-        showlegend=False,
-        hovermode="x unified",
+    line_bol_down = line(df["Date"], df["bol_down"], "red", "price", yaxis="y99")
+
+    figure_price = make_figure(
+        [price_candles, line_bol_up, line_bol_down], bg_color=bg_color
     )
 
     return figure_price
 
 
-def generate_macd_plot(df, base, target, bg_color="white", opacity=0.3):
-
-    # Creating MACD Chart
-    figure_trend = go.Figure()
+@timed_stage("figure_build")
+def generate_macd_plot(df, base, target, bg_color="white", opacity=0.3, max_points=MAX_POINTS):
 
+    # MACD columns are averaged per bucket, the price line keeps its peaks
+    close_x, close_y = downsample_line(df["Date"], df["close"], max_points)
+    df = downsample_ohlc(df, max_points)
 
-    line_MACD = go.Scatter(
-        x=df["Date"],
-        y=df["MACD"],
-        mode="lines",
-        line=dict(color="green"),
-        name="MACD",
-    )
+    # Creating MACD Chart
+    line_MACD = line(df["Date"], df["MACD"], "green", "MACD")
 
-    line_MACD_Signal = go.Scatter(
-        x=df["Date"],
-        y=df["MACD_Signal"],
-        mode="lines",
-        line=dict(color="red"),
-        name="MACD_Signal",
-    )
+    line_MACD_Signal = line(df["Date"], df["MACD_Signal"], "red", "MACD_Signal")
 
     df["MACD_bar"] = df["MACD"] - df["MACD_Signal"]
 
@@ -229,79 +87,99 @@ def generate_macd_plot(df, base, target, bg_color="white", opacity=0.3):
     color[y < 0] = "firebrick"
     color[y >= 0] = "green"
 
-    bar_MACD = go.Bar(
+    bar_MACD = dict(
+        type="bar",
         x=df["Date"],
         y=df["MACD_bar"],
         marker=dict(color=color.tolist()),
         opacity=opacity,
     )
 
-    figure_trend.add_trace(line_MACD)
-    figure_trend.add_trace(line_MACD_Signal)
-    figure_trend.add_trace(bar_MACD)
-
-    figure_trend.add_trace(
-        go.Scatter(
-            x=df["Date"],
-            y=df["close"],
-            mode="lines",
-            yaxis="y99",
-            name="price",
-            line=dict(color="lightgray"),
-        )
+    line_price = line(close_x, close_y, "lightgray", "price", yaxis="y99")
+
+    figure_trend = make_figure(
+        [line_MACD, line_MACD_Signal, bar_MACD, line_price], bg_color=bg_color
+    )
+    return figure_trend
+
+
+
+
+@timed_stage("figure_build")
+def generate_volume_bars(df, base, target, bg_color="white", opacity=0.3, max_points=MAX_POINTS):
+
+    # Volumes are summed per bucket
+    df = downsample_ohlc(df, max_points)
+
+    bar_volume = dict(
+        type="bar",
+        x=df["Date"],
+        y=df["volume"],
+        marker=dict(color="#2596be"),
+        opacity=opacity,
+        name="volume",
     )
 
-    figure_trend.update_layout(
-        **{
-            "yaxis99": dict(
-                overlaying="y",
-                showticklabels=True,
-                side="right",
-                title="price",
-                color="lightgray",
-            )
-        }
+    figure_volume = make_figure([bar_volume], bg_color=bg_color)
+    return figure_volume
+
+
+@timed_stage("figure_build")
+def generate_returns_heatmap(returns, bg_color="white"):
+
+    # Symbols ranked top down, red / green around a 0% change
+    returns_map = heatmap(
+        returns,
+        colorscale="RdYlGn",
+        zmid=0,
+        hovertemplate="%{y} %{x}<br>%{z:.2f}%<extra></extra>",
     )
-    figure_trend.update_xaxes(
-        showspikes=True,
-        spikecolor="gray",
-        spikesnap="cursor",
-        spikemode="across",
-        spikethickness=1,
+
+    figure_returns = make_figure(
+        [returns_map],
+        bg_color=bg_color,
+        yaxis=dict(autorange="reversed", dtick=1),
+        hovermode="closest",
     )
+    return figure_returns
 
-    figure_trend.update_yaxes(
-        showspikes=True,
-        spikecolor="gray",
-        spikesnap="cursor",
-        spikemode="across",
-        spikethickness=1,
+
+@timed_stage("figure_build")
+def generate_correlation_plot(correlation, bg_color="white"):
+
+    correlation_map = heatmap(
+        correlation,
+        colorscale="RdBu",
+        reversescale=True,
+        zmin=-1,
+        zmax=1,
+        hovertemplate="%{y} / %{x}<br>%{z:.2f}<extra></extra>",
     )
 
-    figure_trend.update_layout(
-        barmode="relative",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1,
-            font=dict(size=10),
-        ),
-        plot_bgcolor=bg_color,
-        yaxis=dict(
-            showgrid=True,
-            gridwidth=1,
-            gridcolor="#F3f3f3",
-            showticklabels=True,
-        ),
-        margin={"b": 0, "t": 0},
-        showlegend=False,
-        hovermode="x unified",
+    figure_correlation = make_figure(
+        [correlation_map],
+        bg_color=bg_color,
+        xaxis=dict(dtick=1),
+        yaxis=dict(autorange="reversed", dtick=1),
+        hovermode="closest",
     )
-    return figure_trend
+    return figure_correlation
+
 
+@timed_stage("figure_build")
+def generate_rolling_plot(rolling, reference, bg_color="white"):
 
+    # One line per symbol, the reference itself is constant. Numpy dates
+    # are encoded as one array, a DatetimeIndex one Timestamp at a time
+    dates = rolling.index.values
+    lines = [
+        line(dates, rolling[symbol].to_numpy(), None, symbol)
+        for symbol in rolling.columns
+        if symbol != reference
+    ]
+
+    figure_rolling = make_figure(lines, bg_color=bg_color, showlegend=True, hovermode="closest")
+    return figure_rolling
 
 
 def calculate_perc_vs_initial_date(df, col):
@@ -376,37 +254,69 @@ def create_percent_change_vs_initial_div(pc, pc_color, initial_date):
     )
 
 
-def monthdelta(date, month_delta):
+def create_kpi_table(kpis, base):
     """
-    Calculates day difference of month_delta
+    Ranked kpi table of the overview page, returns colored like the kpi cards
     """
-    m, y = (
-        (date.month + month_delta) % 12,
-        date.year + ((date.month) + month_delta - 1) // 12,
-    )
-    if not m:
-        m = 12
-    d = min(
-        date.day,
-        [
-            31,
-            29 if y % 4 == 0 and (not y % 100 == 0 or y % 400 == 0) else 28,
-            31,
-            30,
-            31,
-            30,
-            31,
-            31,
-            30,
-            31,
-            30,
-            31,
-        ][m - 1],
+    header = html.Thead(
+        html.Tr(
+            [
+                html.Th(label)
+                for label in ["#", "Symbol", "Last ({})".format(base), "Return", "Volatility", "Max drawdown"]
+            ]
+        )
     )
-    date_prev = date.replace(day=d, month=m, year=y)
-    difference = date - date_prev
+    rows = [
+        html.Tr(
+            [
+                html.Td(rank + 1),
+                html.Td(row["symbol"], style={"font-weight": "bold"}),
+                html.Td(np.format_float_positional(row["last"], precision=6, unique=False, fractional=False, trim="-")),
+                html.Td(
+                    "{:.2f}%".format(row["return"]),
+                    style={"color": color_percent_change(row["return"])},
+                ),
+                html.Td("{:.1f}%".format(row["volatility"])),
+                html.Td("{:.1f}%".format(row["max_drawdown"])),
+            ]
+        )
+        for rank, row in kpis.iterrows()
+    ]
+    return dbc.Table([header, html.Tbody(rows)], size="sm", hover=True, className="overview-table")
+
+
+# Date labels of the range selector per candle resolution
+DATE_FORMATS = {"1m": "%b %d, %H:%M", "1h": "%b %d, %H:%M", "1d": "%b %d, %Y"}
+
+# Number of date labels under the range slider
+SLIDER_MARKS = 4
+
+
+def months_back(dates, months):
+    """
+    First of the sorted dates within months calendar months of the last
+    one, whatever the resolution or gaps. The first date when months is None.
+    """
+    if months is None:
+        return dates[0]
+    start = pd.Timestamp(dates[-1]) - pd.DateOffset(months=months)
+    return dates[np.searchsorted(dates, start.to_datetime64())]
+
+
+def format_date(date, date_format):
+    return pd.Timestamp(date).strftime(date_format)
 
-    return difference.days
+
+def slider_marks(start, end, date_format, count=SLIDER_MARKS):
+    """
+    Date labels of the range slider, count evenly spaced marks between the
+    start and end epoch seconds
+    """
+    seconds = np.linspace(int(start), int(end), count).astype(int)
+    return {
+        int(x): format_date(np.datetime64(int(x), "s"), date_format)
+        for x in seconds
+    }
 
 
 def create_tooltip(id, tooltip_text):
@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict
+
+from app_cache import combine_versions, frame_path, read_frame
+from app_store import RESOLUTION
+from app_metrics import timed_stage
+
+
+# Trained models of models/forecast_pipeline.py, the models package is only
+# imported when a symbol has one
+TRAINED_DIR = os.path.join("models", "trained")
+
+# Forecaster served on the ML page
+FORECAST_MODEL = os.environ.get("CRYPTODASH_FORECAST_MODEL", "lstm")
+
+# Number of loaded models kept per worker
+MAX_MODELS = int(os.environ.get("CRYPTODASH_MAX_MODELS", 8))
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first
+    caller runs func, the others wait for its result (or exception)
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event()}
+
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = func()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+
+class ModelCache:
+    """
+    LRU of loaded forecasters keyed by (symbol, model, version), the
+    version being the mtime of the saved model. Loads are coalesced.
+    """
+
+    def __init__(self, max_models=MAX_MODELS, loader=None):
+        self.max_models = max_models
+        self.loader = loader
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get(self, path, key):
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+        forecaster = self._flight.run(key, lambda: self.load(path))
+
+        with self._lock:
+            self._models[key] = forecaster
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+        return forecaster
+
+    def load(self, path):
+        if self.loader is None:
+            from models.forecasters import load_forecaster
+
+            self.loader = load_forecaster
+        return self.loader(path)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+class InferenceServer:
+    """
+    Forecast frames computed in the worker from the latest candles and the
+    trained model of a symbol, in the data/pred csv schema. Symbols without
+    a trained model fall back to their static data/pred csv.
+    """
+
+    def __init__(self, frame_cache, model=FORECAST_MODEL, trained_dir=TRAINED_DIR, max_models=MAX_MODELS):
+        self.frame_cache = frame_cache
+        self.model = model
+        self.trained_dir = trained_dir
+        self.models = ModelCache(max_models)
+        self._flight = SingleFlight()
+
+    def model_path(self, symbol):
+        return os.path.join(self.trained_dir, self.model, symbol)
+
+    def model_version(self, symbol):
+        try:
+            return os.stat(os.path.join(self.model_path(symbol), "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def version(self, symbol, resolution=RESOLUTION):
+        """
+        Changes when either the model or the daily candles of the symbol change
+        """
+        model_version = self.model_version(symbol)
+        if model_version is None:
+            return os.stat(frame_path(symbol, "pred")).st_mtime_ns
+        return combine_versions(model_version, self.frame_cache.version(symbol, "ohlc"))
+
+    def forecast_frame(self, symbol, kind="pred", resolution=RESOLUTION):
+        model_version = self.model_version(symbol)
+        if model_version is None:
+            return read_frame(symbol, "pred")
+        key = (symbol, self.model, model_version, self.frame_cache.version(symbol, "ohlc"))
+        return self._flight.run(key, lambda: self._forecast(symbol, model_version))
+
+    @timed_stage("inference")
+    def _forecast(self, symbol, model_version):
+        from models.forecast_pipeline import HISTORY_ROWS, HORIZON, TEST_ROWS, pred_frame
+        from models.forecasters import read_forecaster_meta
+
+        path = self.model_path(symbol)
+        forecaster = self.models.get(path, (symbol, self.model, model_version))
+        meta = read_forecaster_meta(path)
+        history = meta.get("history", HISTORY_ROWS)
+        test_rows = meta.get("test_rows", TEST_ROWS)
+        horizon = meta.get("horizon", HORIZON)
+
+        df, _ = self.frame_cache.get(symbol, "ohlc")
+        preds = forecaster.predict(df, test_rows, horizon)
+        return pred_frame(df, preds, history, test_rows, horizon)
+
+
+def register_inference(frame_cache, model=FORECAST_MODEL):
+    """
+    Serves the "pred" frames of frame_cache from the inference server
+    """
+    server = InferenceServer(frame_cache, model)
+    frame_cache.register_kind("pred", server.forecast_frame, server.version)
+    return server
@@ -1,52 +1,216 @@
-from sklearn.cluster import KMeans
-from matplotlib import pyplot as plt
-import matplotlib.ticker as mpticker
-import pandas as pd
+import threading
+from collections import OrderedDict
+
 import numpy
 
+from app_cache import parse_stash_token
+
+
+# Largest number of centers tried by the elbow method
+MAX_K = 10
+
+# Sorted values are compressed into at most MAX_BINS weighted points
+MAX_BINS = 512
+
+# Number of (symbol, window) levels kept in memory
+MAX_CACHED_LEVELS = 128
+
+# Relative drift of the centers since the last full fit (or breakout of new
+# candles beyond the outer centers) above which the online update is
+# replaced by a full refit
+DRIFT_THRESHOLD = 0.05
 
-def get_optimum_clusters(df, saturation_point=0.05):
+
+def _compress(values, max_bins=MAX_BINS):
+    """
+    Sorted weighted points standing for values: unique values with their
+    counts, or equal count bins (weighted by size) for long windows
+    """
+    x = numpy.sort(numpy.asarray(values, dtype=float))
+    x = x[~numpy.isnan(x)]
+    if len(x) <= max_bins:
+        return numpy.unique(x, return_counts=True)
+    bins = numpy.array_split(x, max_bins)
+    points = numpy.array([b.mean() for b in bins])
+    weights = numpy.array([len(b) for b in bins])
+    return points, weights
+
+
+def get_optimum_clusters(values, saturation_point=0.05, max_k=MAX_K):
     '''
-    :param df: dataframe
-    :param saturation_point: The amount of difference we are willing to detect
-    :return: clusters with optimum K centers
-    This method uses elbow method to find the optimum number of K clusters
-    We initialize different K-means with 1..10 centers and compare the inertias
-    If the difference is no more than saturation_point, we choose that as K and move on
+    :param values: 1-D prices (e.g. the low or high column)
+    :param saturation_point: relative drop of inertia under which adding a center stops
+    :return: sorted centers with the optimum K
+    1-D k-means has an exact solution over sorted values (Jenks natural breaks),
+    computed here by dynamic programming for k = 1, 2, ... in one pass.
+    We stop as soon as one more center reduces the inertia by less than
+    saturation_point of the k=1 inertia (elbow method).
     '''
+    points, weights = _compress(values)
+    n = len(points)
+    if n == 0:
+        return numpy.empty(0)
 
-    wcss = []
-    k_models = []
-
-    size = min(11, len(df.index))
-    for i in range(1, size):
-        kmeans = KMeans(n_clusters=i, init='k-means++', max_iter=300, n_init=10, random_state=0)
-        kmeans.fit(df)
-        wcss.append(kmeans.inertia_)
-        k_models.append(kmeans)
-
-    # Compare differences in inertias until it's no more than saturation_point
-    optimum_k = len(wcss)-1
-    for i in range(0, len(wcss)-1):
-        diff = abs(wcss[i+1] - wcss[i])
-        if diff < saturation_point:
-            optimum_k = i
+    # Centering keeps the prefix sums small and the costs accurate
+    x = points - points.mean()
+    W = numpy.concatenate([[0], numpy.cumsum(weights)])
+    S = numpy.concatenate([[0], numpy.cumsum(weights * x)])
+    Q = numpy.concatenate([[0], numpy.cumsum(weights * x * x)])
+
+    # cost[j, i]: within cluster sum of squares of points j..i
+    j = numpy.arange(n)[:, None]
+    i = numpy.arange(n)[None, :]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        cost = (Q[i + 1] - Q[j]) - (S[i + 1] - S[j]) ** 2 / (W[i + 1] - W[j])
+    cost = numpy.where(i >= j, numpy.maximum(cost, 0), numpy.inf)
+
+    dp = cost[0]
+    inertias = [dp[-1]]
+    starts = []
+    for k in range(2, min(max_k, n) + 1):
+        # Last cluster starts at row j, the k-1 others cover points 0..j-1
+        candidates = dp[:-1, None] + cost[1:, :]
+        best = candidates.argmin(axis=0)
+        new_dp = candidates[best, numpy.arange(n)]
+        if inertias[0] == 0 or (inertias[-1] - new_dp[-1]) / inertias[0] < saturation_point:
             break
+        starts.append(best + 1)
+        inertias.append(new_dp[-1])
+        dp = new_dp
+
+    # Walk the cluster starts back from the last point
+    bounds = [n]
+    end = n - 1
+    for start in reversed(starts):
+        bounds.append(start[end])
+        end = start[end] - 1
+    bounds.append(0)
+    bounds = sorted(set(bounds))
+
+    centers = [
+        (S[b] - S[a]) / (W[b] - W[a]) + points.mean()
+        for a, b in zip(bounds[:-1], bounds[1:])
+    ]
+    return numpy.sort(numpy.array(centers))
+
+
+def get_levels(df, saturation_point=0.05):
+    """
+    Support (low centers) and resistance (high centers) levels of an OHLC df
+    """
+    low_centers = get_optimum_clusters(df["low"], saturation_point)
+    high_centers = get_optimum_clusters(df["high"], saturation_point)
+    return low_centers, high_centers
+
+
+class LevelTracker:
+    """
+    Online k-means over one price column of a trailing window. New values
+    move their nearest center by 1/count, with counts capped at the window
+    length so old candles fade out like in a sliding window.
+    """
+
+    def __init__(self, values, window, saturation_point=0.05):
+        self.window = window
+        self.saturation_point = saturation_point
+        self.refit(values)
+
+    def refit(self, values):
+        values = numpy.asarray(values, dtype=float)
+        values = values[~numpy.isnan(values)]
+        self.centers = get_optimum_clusters(values, self.saturation_point)
+        self.fitted_centers = self.centers.copy()
+        nearest = numpy.abs(values[:, None] - self.centers[None, :]).argmin(axis=1)
+        self.counts = numpy.bincount(nearest, minlength=len(self.centers)).astype(float)
+        self.refits = getattr(self, "refits", 0) + 1
+
+    def drift(self, new_values):
+        shift = numpy.abs(self.centers - self.fitted_centers) / self.fitted_centers
+        breakout = numpy.maximum(
+            self.centers.min() - new_values, new_values - self.centers.max()
+        ) / new_values
+        return max(shift.max(initial=0), breakout.max(initial=0))
+
+    def update(self, new_values, window_values):
+        """
+        Update from the new candles, refit on window_values when drifting
+        """
+        new_values = numpy.asarray(new_values, dtype=float)
+        new_values = new_values[~numpy.isnan(new_values)]
+        if not len(self.centers) or self.drift(new_values) > DRIFT_THRESHOLD:
+            self.refit(window_values)
+            return numpy.sort(self.centers)
+        for x in new_values:
+            k = numpy.abs(self.centers - x).argmin()
+            self.counts[k] = min(self.counts[k] + 1, self.window)
+            self.centers[k] += (x - self.centers[k]) / self.counts[k]
+        if self.drift(new_values) > DRIFT_THRESHOLD:
+            self.refit(window_values)
+        return numpy.sort(self.centers)
+
+
+class LevelCache:
+    """
+    LRU cache of levels keyed by (stash token, window start, window end).
+    Windows of a given length keep a tracker per symbol so that, when new
+    candles arrive (new stash version), levels are updated online instead
+    of refitting the whole window. A tracker is read, updated and stored
+    under the lock of its key, concurrent requests for the same window
+    wait for each other.
+    """
+
+    def __init__(self, max_items=MAX_CACHED_LEVELS):
+        self.max_items = max_items
+        self._levels = OrderedDict()
+        self._trackers = OrderedDict()
+        self._tracker_locks = {}
+        self._lock = threading.Lock()
 
-    optimum_clusters = k_models[optimum_k]
+    def _tracker_lock(self, tracker_key):
+        with self._lock:
+            # Drop the idle locks of evicted trackers
+            for key in [k for k, lock in self._tracker_locks.items() if k not in self._trackers and not lock.locked()]:
+                del self._tracker_locks[key]
+            return self._tracker_locks.setdefault(tracker_key, threading.Lock())
 
-    lows = pd.DataFrame(data=df, index=df.index, columns=["low"])
-    highs = pd.DataFrame(data=df, index=df.index, columns=["high"])
+    def _store(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_items:
+                cache.popitem(last=False)
 
-    low_clusters = get_optimum_clusters(lows)
-    low_centers = low_clusters.cluster_centers_
-    low_centers = numpy.sort(low_centers, axis=0)
+    def get(self, token, df):
+        if not len(df):
+            return numpy.empty(0), numpy.empty(0)
+        key = (token, df["Date"].iloc[0], df["Date"].iloc[-1])
+        with self._lock:
+            if key in self._levels:
+                self._levels.move_to_end(key)
+                return self._levels[key]
 
-    high_clusters = get_optimum_clusters(highs)
-    high_centers = high_clusters.cluster_centers_
-    high_centers = numpy.sort(high_centers, axis=0)
+        kind, symbol, resolution, _ = parse_stash_token(token)
+        tracker_key = (kind, symbol, resolution, len(df))
+        with self._tracker_lock(tracker_key):
+            with self._lock:
+                entry = self._trackers.get(tracker_key)
 
-    return optimum_clusters , low_centers, high_centers
+            last_date = df["Date"].iloc[-1]
+            if entry is not None and entry[0] < last_date and (df["Date"] == entry[0]).any():
+                previous_date, low_tracker, high_tracker = entry
+                new_rows = df[df["Date"] > previous_date]
+                levels = (
+                    low_tracker.update(new_rows["low"], df["low"]),
+                    high_tracker.update(new_rows["high"], df["high"]),
+                )
+            else:
+                low_tracker = LevelTracker(df["low"], len(df))
+                high_tracker = LevelTracker(df["high"], len(df))
+                levels = (numpy.sort(low_tracker.centers), numpy.sort(high_tracker.centers))
 
+            self._store(self._trackers, tracker_key, (last_date, low_tracker, high_tracker))
+        self._store(self._levels, key, levels)
+        return levels
 
 
+level_cache = LevelCache()
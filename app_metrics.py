@@ -0,0 +1,223 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, request
+
+
+# Callback running on this thread, labels the payload sizes of its response
+_current = threading.local()
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram with one series per label value
+    """
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self.lock:
+            counts, total, n = self.series.get(
+                label_value, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[label_value] = (counts, total + value, n + 1)
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.help_text),
+            "# TYPE {} histogram".format(self.name),
+        ]
+        with self.lock:
+            for label_value, (counts, total, n) in sorted(self.series.items()):
+                labels = '{}="{}"'.format(self.label, label_value)
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(
+                        '{}_bucket{{{},le="{}"}} {}'.format(self.name, labels, bound, count)
+                    )
+                lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(self.name, labels, n))
+                lines.append("{}_sum{{{}}} {}".format(self.name, labels, total))
+                lines.append("{}_count{{{}}} {}".format(self.name, labels, n))
+        return "\n".join(lines)
+
+
+callback_seconds = Histogram(
+    "cryptodash_callback_seconds", "Wall time of dash callbacks", "callback", SECONDS_BUCKETS
+)
+payload_in_bytes = Histogram(
+    "cryptodash_callback_payload_in_bytes", "Serialized callback arguments", "callback", BYTES_BUCKETS
+)
+payload_out_bytes = Histogram(
+    "cryptodash_callback_payload_out_bytes", "Serialized callback outputs", "callback", BYTES_BUCKETS
+)
+stage_seconds = Histogram(
+    "cryptodash_stage_seconds", "Wall time of callback stages (frame load, figure build)", "stage", SECONDS_BUCKETS
+)
+
+HISTOGRAMS = [callback_seconds, payload_in_bytes, payload_out_bytes, stage_seconds]
+
+
+def payload_size(value):
+    from plotly.io.json import to_json_plotly
+
+    return len(to_json_plotly(value))
+
+
+def timed_callback(name):
+    """
+    Record the wall time of a callback, goes under @app.callback. Payload
+    bytes are taken from the request and response Dash already serialized
+    (see register_metrics_routes).
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            _current.callback = name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                callback_seconds.observe(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(name, time.perf_counter() - start)
+
+
+def timed_stage(name):
+    """
+    Decorator version of stage
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render_metrics():
+    return "\n".join(h.render() for h in HISTOGRAMS) + "\n"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all other threads every interval seconds and
+    counts them as folded stacks (flamegraph.pl / speedscope input)
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread = None
+        self.running = threading.Event()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.running.is_set():
+            return
+        self.stacks.clear()
+        self.running.set()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _after_fork(self):
+        # The sampling thread does not survive fork, e.g. gunicorn workers
+        # forked from a preloaded app
+        if self.running.is_set():
+            self.running.clear()
+            self.thread = None
+            self.start()
+
+    def folded(self):
+        return "\n".join(
+            "{} {}".format(stack, count) for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+
+profiler = SamplingProfiler()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=profiler._after_fork)
+
+
+def register_metrics_routes(server):
+    """
+    /metrics in Prometheus text format, /metrics/profile?action=start|stop
+    toggles the sampling profiler and returns the folded stacks. Metrics are
+    per worker process.
+    """
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    @server.route("/metrics/profile")
+    def metrics_profile():
+        action = request.args.get("action")
+        if action == "start":
+            profiler.start()
+        elif action == "stop":
+            profiler.stop()
+        return Response(profiler.folded(), mimetype="text/plain")
+
+    @server.after_request
+    def record_payload(response):
+        name = getattr(_current, "callback", None)
+        if name is not None and request.path.endswith("/_dash-update-component"):
+            _current.callback = None
+            payload_in_bytes.observe(name, request.content_length or 0)
+            if response.content_length is not None:
+                payload_out_bytes.observe(name, response.content_length)
+        return response
+
+    if os.environ.get("CRYPTODASH_PROFILE") == "1":
+        profiler.start()
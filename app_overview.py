@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app_cache import frame_cache
+from app_crossrate import CROSS_BASES, cross_kind
+from app_metrics import timed_stage
+from app_store import RESOLUTION, RESOLUTION_NS, read_symbols_manifest
+
+
+# Candles per year of each resolution (crypto trades 24/7), annualizes the
+# volatility
+CANDLES_PER_YEAR = {r: 365 * 86400 * 10**9 / ns for r, ns in RESOLUTION_NS.items()}
+
+# Columns of the returns heatmap: daily up to 45 days, then weekly up to
+# about a year, then monthly
+HEATMAP_BUCKETS = [(pd.Timedelta(days=45), "D"), (pd.Timedelta(days=400), "W"), (None, "MS")]
+
+# Number of (base, resolution, period) overviews kept in memory
+MAX_OVERVIEWS = 32
+
+
+def close_matrix(frames):
+    """
+    Wide frame of closes, one column per symbol, outer joined on Date.
+    Candles a symbol does not have (before its listing, gaps) are NaN.
+    """
+    columns = [
+        pd.Series(df["close"].to_numpy(dtype=float), index=df["Date"].values, name=symbol)
+        for symbol, df in frames.items()
+    ]
+    return pd.concat(columns, axis=1, sort=True)
+
+
+def heatmap_bucket(start, end):
+    for span, freq in HEATMAP_BUCKETS:
+        if span is None or end - start <= span:
+            return freq
+
+
+def overview_stats(matrix, start=None, end=None, resolution=RESOLUTION):
+    """
+    Returns heatmap, correlation matrix and ranked KPIs of the closes
+    between start and end (epoch seconds, inclusive), in one pass over the
+    whole matrix:
+        returns: % change per heatmap bucket, symbols x buckets
+        correlation: pairwise correlation of the log returns per candle
+        kpis: last close, % return, annualized % volatility and % max
+              drawdown over the period, best return first
+    """
+    dates = matrix.index.values
+    i = 0 if start is None else np.searchsorted(dates, np.datetime64(start, "s"), "left")
+    j = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, "s"), "right")
+    window = matrix.iloc[i:j]
+    window = window.loc[:, window.notna().any()]
+    if window.empty:
+        # No candle in the period, empty tables rather than an error
+        return {
+            "returns": pd.DataFrame(),
+            "correlation": pd.DataFrame(),
+            "kpis": pd.DataFrame(columns=["symbol", "last", "return", "volatility", "max_drawdown"]),
+        }
+
+    close = window.to_numpy()
+    # Missing candles carry the last close, so returns span the gaps
+    filled = window.ffill().to_numpy()
+    first = close[np.argmax(~np.isnan(close), axis=0), np.arange(close.shape[1])]
+    last = filled[-1]
+
+    log_returns = np.diff(np.log(filled), axis=0)
+    drawdown = filled / np.fmax.accumulate(filled, axis=0) - 1
+    with np.errstate(invalid="ignore"):
+        volatility = np.nanstd(log_returns, axis=0, ddof=1) * np.sqrt(CANDLES_PER_YEAR[resolution])
+
+    kpis = pd.DataFrame(
+        {
+            "symbol": window.columns,
+            "last": last,
+            "return": (last / first - 1) * 100,
+            "volatility": volatility * 100,
+            "max_drawdown": np.nanmin(drawdown, axis=0) * 100,
+        }
+    ).sort_values("return", ascending=False, ignore_index=True)
+
+    # Bucket returns, the first bucket starts from the first close in the window
+    buckets = pd.DataFrame(filled, index=window.index, columns=window.columns)
+    buckets = buckets.resample(heatmap_bucket(window.index[0], window.index[-1])).last()
+    previous = buckets.shift(1)
+    previous.iloc[0] = first
+    returns = (buckets / previous - 1).T * 100
+
+    correlation = pd.DataFrame(log_returns, columns=window.columns).corr()
+
+    ranked = kpis["symbol"]
+    return {
+        "returns": returns.loc[ranked],
+        "correlation": correlation.loc[ranked, ranked],
+        "kpis": kpis,
+    }
+
+
+class MarketOverview:
+    """
+    Overview of all the symbols in a base. The close matrix of a (base,
+    resolution) is rebuilt only when the version of one of its frames
+    changes, computed overviews are kept per period in an LRU.
+    """
+
+    def __init__(self, frame_cache, symbols=None, max_overviews=MAX_OVERVIEWS):
+        self.frame_cache = frame_cache
+        self.symbols = symbols or read_symbols_manifest()
+        self.max_overviews = max_overviews
+        self._matrices = {}
+        self._overviews = OrderedDict()
+        self._lock = threading.Lock()
+
+    def versions(self, base, resolution):
+        """
+        Version of the frame of every symbol quoted in base, symbols
+        without candles at this resolution are left out
+        """
+        kind = cross_kind(base)
+        versions = {}
+        for symbol in self.symbols:
+            if base in CROSS_BASES and symbol == base:
+                continue
+            try:
+                versions[symbol] = self.frame_cache.version(symbol, kind, resolution)
+            except FileNotFoundError:
+                continue
+        return versions
+
+    def matrix(self, base, resolution, versions):
+        key = (base, resolution)
+        with self._lock:
+            entry = self._matrices.get(key)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+
+        matrix = self._build(base, resolution, versions)
+        with self._lock:
+            self._matrices[key] = (versions, matrix)
+        return matrix
+
+    @timed_stage("overview_matrix")
+    def _build(self, base, resolution, versions):
+        kind = cross_kind(base)
+        frames = {symbol: self.frame_cache.get(symbol, kind, resolution)[0] for symbol in versions}
+        return close_matrix(frames)
+
+    @timed_stage("overview")
+    def get(self, base="USD", resolution=RESOLUTION, start=None, end=None):
+        versions = self.versions(base, resolution)
+        key = (base, resolution, start, end, tuple(versions.items()))
+        with self._lock:
+            if key in self._overviews:
+                self._overviews.move_to_end(key)
+                return self._overviews[key]
+
+        overview = overview_stats(self.matrix(base, resolution, versions), start, end, resolution)
+
+        with self._lock:
+            self._overviews[key] = overview
+            while len(self._overviews) > self.max_overviews:
+                self._overviews.popitem(last=False)
+        return overview
+
+
+market_overview = MarketOverview(frame_cache)
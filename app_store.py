@@ -0,0 +1,364 @@
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app_downsample import FIRST_COLUMNS, MAX_COLUMNS, MIN_COLUMNS, SUM_COLUMNS
+from indicators import BOLLINGER_COLUMNS, add_bollinger, bollinger_bands, macd
+
+
+DATA_DIR = "data"
+STORE_DIR = os.path.join(DATA_DIR, "store")
+# Resolution of the data/*_OHLC.csv files
+RESOLUTION = "1d"
+
+# Stored resolutions, finest first, with their candle length
+RESOLUTIONS = ["1m", "1h", "1d"]
+RESOLUTION_NS = {"1m": 60 * 10**9, "1h": 3600 * 10**9, "1d": 86400 * 10**9}
+
+# Coarser resolution -> finer resolution it is rolled up from
+ROLLUP_SOURCE = {"1h": "1m", "1d": "1h"}
+
+# Stored candles preceding an append that warm up the indicators of the new
+# rows, the slowest MACD ema forgets its seed by (25/27)^500 ~ 1e-17
+INDICATOR_WARMUP = 500
+
+# Symbols offered by the dashboard, written whenever data/*_OHLC.csv change
+# so that workers do not scan the data folder on boot
+SYMBOLS_MANIFEST = "symbols.json"
+
+# Typed columns kept in the binary store, closeTime and ignore are dropped
+STORE_COLUMNS = {
+    "Date": "<i8",
+    "open": "<f8",
+    "high": "<f8",
+    "low": "<f8",
+    "close": "<f8",
+    "volume": "<f8",
+    "quoteAssetVolume": "<f8",
+    "numberOfTrades": "<i8",
+    "takerBuyBaseVol": "<f8",
+    "takerBuyQuoteVol": "<f8",
+    "MACD": "<f8",
+    "MACD_Signal": "<f8",
+    "bol_up": "<f8",
+    "SMA_20": "<f8",
+    "bol_down": "<f8",
+}
+
+
+def csv_path(symbol, data_dir=DATA_DIR):
+    return os.path.join(data_dir, "{}_OHLC.csv".format(symbol))
+
+
+def store_path(symbol, resolution=RESOLUTION, store_dir=STORE_DIR):
+    return os.path.join(store_dir, symbol, resolution)
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(symbol, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """
+    True when the binary store is missing or older than the csv
+    """
+    meta = read_meta(store_path(symbol, store_dir=store_dir))
+    if meta is None:
+        return True
+    stat = os.stat(csv_path(symbol, data_dir))
+    return (
+        meta.get("source_mtime_ns") != stat.st_mtime_ns
+        or meta.get("source_size") != stat.st_size
+    )
+
+
+def replace_file(file, data):
+    """
+    Write data to a temporary file next to file and rename it over file.
+    Memory maps of the old file stay valid (they keep the old inode) and
+    concurrent writers never interleave.
+    """
+    tmp = "{}.{}.{}.tmp".format(file, os.getpid(), threading.get_ident())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, file)
+
+
+def write_columns(df, path, source_stat=None):
+    """
+    Write each column of df as a raw little endian file plus meta.json.
+    Every file is replaced atomically, meta.json last so a partial write is
+    seen as stale.
+    """
+    os.makedirs(path, exist_ok=True)
+    columns = {}
+    for col, dtype in STORE_COLUMNS.items():
+        if col not in df.columns:
+            continue
+        if col == "Date":
+            values = pd.to_datetime(df[col]).values.astype("datetime64[ns]")
+            values = values.view("<i8")
+        else:
+            values = pd.to_numeric(df[col]).to_numpy(dtype=dtype)
+        replace_file(os.path.join(path, col + ".bin"), values.tobytes())
+        columns[col] = dtype
+
+    meta = {"rows": len(df), "columns": columns}
+    if source_stat is not None:
+        meta["source_mtime_ns"] = source_stat.st_mtime_ns
+        meta["source_size"] = source_stat.st_size
+    replace_file(os.path.join(path, "meta.json"), json.dumps(meta).encode())
+
+
+def convert_csv(symbol, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """
+    Convert data/{symbol}_OHLC.csv to the binary store, returns the parsed df
+    """
+    path = csv_path(symbol, data_dir)
+    stat = os.stat(path)
+    df = pd.read_csv(path, usecols=lambda c: c in STORE_COLUMNS)
+    if not set(BOLLINGER_COLUMNS) <= set(df.columns):
+        add_bollinger(df)
+    write_columns(df, store_path(symbol, store_dir=store_dir), stat)
+    df["Date"] = pd.to_datetime(df["Date"])
+    return df
+
+
+def read_columns(path, meta=None, mmap=True):
+    """
+    Build a df over the column files of a store directory. With mmap the
+    columns are read-only memory maps, no parsing or copying is done.
+    """
+    if meta is None:
+        meta = read_meta(path)
+    data = {}
+    for col, dtype in meta["columns"].items():
+        file = os.path.join(path, col + ".bin")
+        if meta["rows"] == 0:
+            values = np.empty(0, dtype=dtype)
+        elif mmap:
+            values = np.memmap(file, dtype=dtype, mode="r", shape=(meta["rows"],))
+        else:
+            values = np.fromfile(file, dtype=dtype, count=meta["rows"])
+        if col == "Date":
+            values = values.view("datetime64[ns]")
+        data[col] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def csv_backed(symbol, resolution=RESOLUTION, data_dir=DATA_DIR):
+    """
+    True when the store of this resolution is a cache of data/{symbol}_OHLC.csv
+    """
+    return resolution == RESOLUTION and os.path.exists(csv_path(symbol, data_dir))
+
+
+def load_frame(symbol, data_dir=DATA_DIR, store_dir=STORE_DIR, mmap=True, resolution=RESOLUTION):
+    """
+    Load a symbol from the binary store. Daily candles fall back to the csv
+    (and refresh the store) when it is missing or stale.
+    """
+    if not csv_backed(symbol, resolution, data_dir):
+        return read_columns(store_path(symbol, resolution, store_dir), mmap=mmap)
+    if is_stale(symbol, data_dir, store_dir):
+        try:
+            return convert_csv(symbol, data_dir, store_dir)
+        except OSError:
+            df = pd.read_csv(csv_path(symbol, data_dir), parse_dates=["Date"])
+            if not set(BOLLINGER_COLUMNS) <= set(df.columns):
+                add_bollinger(df)
+            return df.drop(columns=["closeTime", "ignore"], errors="ignore")
+    return read_columns(store_path(symbol, store_dir=store_dir), mmap=mmap)
+
+
+def available_resolutions(symbol, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    return [
+        resolution
+        for resolution in RESOLUTIONS
+        if csv_backed(symbol, resolution, data_dir)
+        or read_meta(store_path(symbol, resolution, store_dir)) is not None
+    ]
+
+
+def pick_resolution(symbol, resolution, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """
+    The requested resolution if stored, else the closest coarser (then
+    finer) one available
+    """
+    if resolution not in RESOLUTIONS:
+        resolution = RESOLUTION
+    available = available_resolutions(symbol, data_dir, store_dir)
+    if not available or resolution in available:
+        return resolution
+    i = RESOLUTIONS.index(resolution)
+    coarser = [r for r in RESOLUTIONS[i + 1 :] if r in available]
+    return coarser[0] if coarser else available[-1]
+
+
+def candles_per_day(resolution):
+    return RESOLUTION_NS["1d"] // RESOLUTION_NS[resolution]
+
+
+def with_indicators(df, previous_close=()):
+    """
+    MACD and Bollinger columns of new candles, warmed up with the closes
+    stored before them
+    """
+    close = np.concatenate([np.asarray(previous_close, dtype=float), df["close"].to_numpy(dtype=float)])
+    n = len(df)
+    line, signal = macd(close)
+    up, mid, down = bollinger_bands(close)
+    df["MACD"], df["MACD_Signal"] = line[-n:], signal[-n:]
+    df["bol_up"], df["SMA_20"], df["bol_down"] = up[-n:], mid[-n:], down[-n:]
+    return df
+
+
+def write_rows(df, path, start_row, resolution):
+    """
+    Write df over the column files from start_row on. Each column is
+    rewritten as its stored rows before start_row followed by the new ones
+    and replaced atomically, memory maps held by readers keep the previous
+    file; meta.json (replaced last) holds the row count.
+    """
+    os.makedirs(path, exist_ok=True)
+    columns = {}
+    for col, dtype in STORE_COLUMNS.items():
+        if col not in df.columns:
+            continue
+        if col == "Date":
+            values = pd.to_datetime(df[col]).values.astype("datetime64[ns]").view("<i8")
+        else:
+            values = pd.to_numeric(df[col]).to_numpy(dtype=dtype)
+        file = os.path.join(path, col + ".bin")
+        kept = b""
+        if start_row and os.path.exists(file):
+            with open(file, "rb") as f:
+                kept = f.read(start_row * np.dtype(dtype).itemsize)
+        replace_file(file, kept + values.tobytes())
+        columns[col] = dtype
+
+    meta = {"rows": start_row + len(df), "columns": columns, "resolution": resolution}
+    replace_file(os.path.join(path, "meta.json"), json.dumps(meta).encode())
+
+
+def append_candles(symbol, df, resolution, store_dir=STORE_DIR):
+    """
+    Append candles sorted by Date to a store. Stored rows from the first new
+    Date on are replaced, e.g. the last candle fetched while still open.
+    Returns the first rewritten row.
+    """
+    path = store_path(symbol, resolution, store_dir)
+    meta = read_meta(path)
+    start_row, previous_close = 0, []
+    if meta is not None and meta["rows"]:
+        stored = read_columns(path, meta)
+        first = np.datetime64(pd.Timestamp(df["Date"].iloc[0]).to_datetime64(), "ns")
+        start_row = int(np.searchsorted(stored["Date"].values, first))
+        previous_close = stored["close"].values[max(0, start_row - INDICATOR_WARMUP) : start_row]
+    df = with_indicators(df.reset_index(drop=True).copy(), previous_close)
+    write_rows(df, path, start_row, resolution)
+    return start_row
+
+
+def rollup_frame(df, resolution):
+    """
+    Aggregate candles into resolution buckets: first open, max high, min
+    low, last close, summed volumes
+    """
+    dates = pd.to_datetime(df["Date"]).values.view("<i8")
+    buckets = dates - dates % RESOLUTION_NS[resolution]
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    ends = np.append(starts[1:], len(df)) - 1
+
+    out = {"Date": buckets[starts].view("datetime64[ns]")}
+    for col in ["open", "high", "low", "close"] + SUM_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy()
+        if col in FIRST_COLUMNS:
+            out[col] = values[starts]
+        elif col in MAX_COLUMNS:
+            out[col] = np.maximum.reduceat(values, starts)
+        elif col in MIN_COLUMNS:
+            out[col] = np.minimum.reduceat(values, starts)
+        elif col in SUM_COLUMNS:
+            out[col] = np.add.reduceat(values, starts)
+        else:
+            out[col] = values[ends]
+    return pd.DataFrame(out)
+
+
+def rollup(symbol, resolution, store_dir=STORE_DIR):
+    """
+    Refresh a coarser store from its source resolution, starting at its
+    last (possibly incomplete) bucket. Returns the number of rows written.
+    """
+    source = read_columns(store_path(symbol, ROLLUP_SOURCE[resolution], store_dir))
+    meta = read_meta(store_path(symbol, resolution, store_dir))
+    start = 0
+    if meta is not None and meta["rows"]:
+        last_bucket = read_columns(store_path(symbol, resolution, store_dir), meta)["Date"].values[-1]
+        start = int(np.searchsorted(source["Date"].values, last_bucket))
+    if start >= len(source):
+        return 0
+    rolled = rollup_frame(source.iloc[start:], resolution)
+    append_candles(symbol, rolled, resolution, store_dir)
+    return len(rolled)
+
+
+def ingest_candles(symbol, df, resolution, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """
+    Append new candles then roll them up into the coarser resolutions,
+    except the csv backed daily store which has its own source
+    """
+    append_candles(symbol, df, resolution, store_dir)
+    for coarser in RESOLUTIONS[RESOLUTIONS.index(resolution) + 1 :]:
+        if csv_backed(symbol, coarser, data_dir):
+            break
+        rollup(symbol, coarser, store_dir)
+
+
+def list_symbols(data_dir=DATA_DIR):
+    return sorted(
+        f.replace("_OHLC.csv", "")
+        for f in os.listdir(data_dir)
+        if f.endswith("_OHLC.csv")
+    )
+
+
+def write_symbols_manifest(data_dir=DATA_DIR):
+    symbols = list_symbols(data_dir)
+    path = os.path.join(data_dir, SYMBOLS_MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"symbols": symbols}, f, indent=2)
+        f.write("\n")
+    os.replace(path + ".tmp", path)
+    return symbols
+
+
+def read_symbols_manifest(data_dir=DATA_DIR):
+    """
+    Symbols of the manifest, rebuilt from the data folder when missing
+    """
+    try:
+        with open(os.path.join(data_dir, SYMBOLS_MANIFEST)) as f:
+            return json.load(f)["symbols"]
+    except FileNotFoundError:
+        return write_symbols_manifest(data_dir)
+
+
+if __name__ == "__main__":
+    # Convert all (or the given) symbols: python app_store.py [BTC ETH ...]
+    symbols = sys.argv[1:] or list_symbols()
+    for symbol in symbols:
+        df = convert_csv(symbol)
+        print("[INFO]: {} converted, {} rows".format(symbol, len(df)))
+    write_symbols_manifest()
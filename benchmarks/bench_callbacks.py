@@ -0,0 +1,206 @@
+# Headless benchmark of the dashboard callbacks, no browser or network needed
+#
+#   python benchmarks/bench_callbacks.py                     # run, write results.json
+#   python benchmarks/bench_callbacks.py --save-baseline     # run and store as baseline
+#   python benchmarks/bench_callbacks.py --compare           # fail on regression vs baseline
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HERE = os.path.dirname(os.path.abspath(__file__))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+
+import app
+from app_cache import format_range, frame_cache, frame_path, make_stash_token, stash_dates
+from app_metrics import payload_size
+from indicators import add_bollinger, macd
+
+RESULTS_PATH = os.path.join(HERE, "results.json")
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+
+SYNTHETIC_SIZES = [10000, 100000, 1000000]
+
+
+def synthetic_frame(n, seed=0):
+    """
+    Hourly random walk OHLC history with the stored indicator columns
+    """
+    rng = np.random.default_rng(seed)
+    close = 20000 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.005, n)) * close
+    df = pd.DataFrame(
+        {
+            "Date": pd.date_range("1950-01-01", periods=n, freq="H"),
+            "open": open_,
+            "high": np.maximum(open_, close) + spread,
+            "low": np.minimum(open_, close) - spread,
+            "close": close,
+            "volume": rng.uniform(100, 1000, n),
+        }
+    )
+    df["MACD"], df["MACD_Signal"] = macd(df["close"])
+    return add_bollinger(df)
+
+
+def trigger(prop_id):
+    context_value.set(AttributeDict(triggered_inputs=[{"prop_id": prop_id, "value": 1}]))
+
+
+def scenarios(symbol, token, dates):
+    """
+    (name, trigger prop_id, callable) for one dataset
+    """
+    window = format_range(dates[max(0, len(dates) - 91)], dates[-1])
+    full = format_range(dates[0], dates[-1])
+    return [
+        ("generate_stash_dfs", "submit-button.n_clicks",
+         lambda: app.generate_stash_dfs(1, "/", symbol, "USD", "1d", None, None)),
+        ("slider_send_update:open", "df-main-stash.children",
+         lambda: app.slider_send_update(token, None, None, None, None, None, None, None, None, None, None, False, False, False, False, False, False)),
+        ("slider_send_update:1Y", "1Y.n_clicks",
+         lambda: app.slider_send_update(token, None, None, None, None, 1, None, None, None, None, None, False, False, True, False, False, False)),
+        ("render_price_kpis", "range-min-max.children",
+         lambda: app.render_price_kpis(token, window, "USD")),
+        ("generate_prices_plot:3M", "range-min-max.children",
+         lambda: app.generate_prices_plot(window, token, symbol, "USD", 1400, None)),
+        ("generate_prices_plot:ALL", "range-min-max.children",
+         lambda: app.generate_prices_plot(full, token, symbol, "USD", 1400, None)),
+        ("generate_prices_plot:ALL:patch", "range-min-max.children",
+         lambda: app.generate_prices_plot(full, token, symbol, "USD", 1400, token)),
+        ("generate_trend_plot:ALL", "range-min-max.children",
+         lambda: app.generate_trend_plot(full, token, symbol, "USD", 1400, None)),
+        ("generate_trend_plot:ALL:patch", "range-min-max.children",
+         lambda: app.generate_trend_plot(full, token, symbol, "USD", 1400, token)),
+        ("generate_volume_plot:ALL", "range-min-max.children",
+         lambda: app.generate_volume_plot(full, token, symbol, "USD")),
+    ]
+
+
+def forecast_scenarios(symbol, token, dates):
+    """
+    ML page scenarios, for the symbols with a forecast frame. The patch
+    scenario changes the window so the level shapes are patched too.
+    """
+    window = format_range(dates[max(0, len(dates) - 31)], dates[-1])
+    full = format_range(dates[0], dates[-1])
+    return [
+        ("generate_forecast_plot:1M", "range-min-max.children",
+         lambda: app.generate_forecast_plot(window, token, symbol, "USD", 1400, None)),
+        ("generate_forecast_plot:ALL", "range-min-max.children",
+         lambda: app.generate_forecast_plot(full, token, symbol, "USD", 1400, None)),
+        ("generate_forecast_plot:ALL:patch", "range-min-max.children",
+         lambda: app.generate_forecast_plot(full, token, symbol, "USD", 1400, token)),
+    ]
+
+
+def measure(func, prop_id, repeat):
+    trigger(prop_id)
+    result = func()
+    payload = payload_size(result)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = np.array(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "peak_mem_kb": peak / 1024,
+        "payload_bytes": payload,
+    }
+
+
+def run(sizes, repeat):
+    datasets = [("BTC", None)]
+    for n in sizes:
+        symbol = "SYN{}".format(n)
+        frame_cache.put(symbol, synthetic_frame(n))
+        datasets.append((symbol, n))
+
+    results = {}
+    for symbol, n in datasets:
+        token = make_stash_token(symbol)
+        dates = stash_dates(token)
+        n_rows = len(dates)
+        # Fewer repeats on the largest histories to keep the run short
+        reps = max(3, repeat if n_rows <= 100000 else repeat // 10)
+        cases = scenarios(symbol, token, dates)
+        if os.path.exists(frame_path(symbol, "pred")):
+            pred_token = make_stash_token(symbol, "pred")
+            cases += forecast_scenarios(symbol, pred_token, stash_dates(pred_token))
+        for name, prop_id, func in cases:
+            key = "{}/{}".format(symbol, name)
+            results[key] = measure(func, prop_id, reps)
+            print("{:45s} p50 {:9.2f} ms  p95 {:9.2f} ms  peak {:9.0f} kB  payload {:9d} B".format(
+                key, results[key]["p50_ms"], results[key]["p95_ms"],
+                results[key]["peak_mem_kb"], results[key]["payload_bytes"]))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the keys whose p50 latency or payload grew more than tolerance x
+    """
+    regressions = []
+    for key, base in baseline["results"].items():
+        current = results.get(key)
+        if current is None:
+            continue
+        for metric in ["p50_ms", "payload_bytes"]:
+            if current[metric] > base[metric] * tolerance and current[metric] - base[metric] > 1:
+                regressions.append("{} {}: {:.1f} -> {:.1f}".format(key, metric, base[metric], current[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard callbacks")
+    parser.add_argument("--sizes", type=int, nargs="*", default=SYNTHETIC_SIZES)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    # Baselines are machine specific and not committed, save one first
+    if args.compare and not os.path.exists(BASELINE_PATH):
+        print("[ERROR]: no baseline at {}, run with --save-baseline first".format(BASELINE_PATH))
+        sys.exit(2)
+
+    output = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": run(args.sizes, args.repeat),
+    }
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(output, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            regressions = compare(output["results"], json.load(f), args.tolerance)
+        for line in regressions:
+            print("[REGRESSION]: " + line)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,55 @@
+# Startup time of a dashboard worker: wall time of "import app" in fresh
+# interpreters, and the slowest imports grouped by top level package
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --repeat 10 --top 15
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_APP = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_seconds():
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_APP], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def import_profile():
+    """
+    Self time in seconds of the imported modules, summed per top level package
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    packages = Counter()
+    for match in IMPORTTIME_LINE.finditer(out.stderr):
+        self_us, _, _, module = match.groups()
+        packages[module.split(".")[0]] += int(self_us) / 1e6
+    return packages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of app.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    timings = [import_seconds() for _ in range(args.repeat)]
+    print("[INFO]: import app: median {:.3f}s, min {:.3f}s, max {:.3f}s over {} runs".format(
+        statistics.median(timings), min(timings), max(timings), len(timings)))
+
+    packages = import_profile()
+    total = sum(packages.values())
+    for package, seconds in packages.most_common(args.top):
+        print("{:30s} {:7.3f}s {:5.1f}%".format(package, seconds, 100 * seconds / total))
@@ -0,0 +1,5 @@
+# Read by gunicorn from the working directory (Procfile: gunicorn app:server)
+
+# Import app once in the master, workers are forked with dash, pandas and
+# the layout already loaded, so boots and recycles do not pay the imports
+preload_app = True
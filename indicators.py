@@ -0,0 +1,236 @@
+"""
+Technical indicators shared by the scraper and the dashboard.
+
+Batch functions take a 1-D array-like and return float numpy arrays aligned
+with it, NaN until enough observations are available (same output as
+pandas ewm(adjust=False, min_periods) / rolling). Leading NaNs are skipped.
+
+State classes carry what is needed to update on one new candle in O(1) and
+can be saved as dicts next to the stored data.
+"""
+import math
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Indicator columns materialized over the full history of each symbol
+BOLLINGER_COLUMNS = ["bol_up", "SMA_20", "bol_down"]
+
+# Largest growth of the per block weights, bounds the rounding error of ema
+_EMA_BLOCK_GROWTH = 1e4
+
+
+def _as_array(values):
+    return np.asarray(values, dtype=float)
+
+
+def ema(values, span, min_periods=0):
+    """
+    Exponential moving average with alpha = 2 / (span + 1), adjust=False.
+    Computed block by block with cumulative sums so only len / block Python
+    iterations are needed.
+    """
+    x = _as_array(values)
+    out = np.full(x.shape, np.nan)
+    valid = ~np.isnan(x)
+    if not valid.any():
+        return out
+    start = int(valid.argmax())
+
+    alpha = 2 / (span + 1)
+    decay = 1 - alpha
+    block = max(1, int(math.log(_EMA_BLOCK_GROWTH) / -math.log(decay)))
+
+    out[start] = prev = x[start]
+    for i in range(start + 1, len(x), block):
+        xb = x[i : i + block]
+        powers = decay ** np.arange(len(xb))
+        acc = np.cumsum(xb / powers)
+        yb = powers * decay * prev + alpha * powers * acc
+        out[i : i + len(xb)] = yb
+        prev = yb[-1]
+
+    if min_periods > 1:
+        out[start : start + min_periods - 1] = np.nan
+    return out
+
+
+def sma(values, n):
+    """
+    Simple moving average over n observations
+    """
+    x = _as_array(values)
+    out = np.full(x.shape, np.nan)
+    if len(x) >= n:
+        out[n - 1 :] = sliding_window_view(x, n).mean(axis=1)
+    return out
+
+
+def rolling_std(values, n, ddof=1):
+    """
+    Rolling standard deviation over n observations
+    """
+    x = _as_array(values)
+    out = np.full(x.shape, np.nan)
+    if len(x) >= n:
+        out[n - 1 :] = sliding_window_view(x, n).std(axis=1, ddof=ddof)
+    return out
+
+
+def bollinger_bands(values, n=20, k=2):
+    """
+    Returns (up, sma, down) bands
+    """
+    mid = sma(values, n)
+    std = rolling_std(values, n)
+    return mid + k * std, mid, mid - k * std
+
+
+def macd(values, fast=12, slow=26, signal=9):
+    """
+    Returns (macd, signal) lines
+    """
+    line = ema(values, fast, fast) - ema(values, slow, slow)
+    return line, ema(line, signal, signal)
+
+
+def add_bollinger(df, n=20, k=2):
+    """
+    Fill the BOLLINGER_COLUMNS of an OHLC df from its close
+    """
+    up, mid, down = bollinger_bands(df["close"], n, k)
+    df["bol_up"], df["SMA_20"], df["bol_down"] = up, mid, down
+    return df
+
+
+class EMAState:
+    """
+    Incremental ema, update returns the new value (NaN before min_periods)
+    """
+
+    def __init__(self, span, min_periods=0, value=None, count=0):
+        self.alpha = 2 / (span + 1)
+        self.min_periods = min_periods
+        self.value = value
+        self.count = count
+
+    def update(self, x):
+        self.count += 1
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value if self.count >= self.min_periods else np.nan
+
+
+class RollingState:
+    """
+    Incremental rolling mean / std over the last n values (Welford updates)
+    """
+
+    def __init__(self, n, values=()):
+        self.n = n
+        self.window = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+        for x in values:
+            self.update(x)
+
+    def update(self, x):
+        self.window.append(x)
+        delta = x - self.mean
+        self.mean += delta / len(self.window)
+        self.m2 += delta * (x - self.mean)
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            delta = old - self.mean
+            self.mean -= delta / len(self.window)
+            self.m2 -= delta * (old - self.mean)
+        return self
+
+    @property
+    def ready(self):
+        return len(self.window) == self.n
+
+    def sma(self):
+        return self.mean if self.ready else np.nan
+
+    def std(self, ddof=1):
+        if not self.ready:
+            return np.nan
+        return math.sqrt(max(self.m2, 0.0) / (self.n - ddof))
+
+
+class BollingerState:
+    """
+    Incremental Bollinger bands, update returns (up, sma, down)
+    """
+
+    def __init__(self, n=20, k=2, values=()):
+        self.k = k
+        self.rolling = RollingState(n, values)
+
+    def update(self, x):
+        self.rolling.update(x)
+        mid = self.rolling.sma()
+        std = self.rolling.std()
+        return mid + self.k * std, mid, mid - self.k * std
+
+
+class MACDState:
+    """
+    Incremental MACD, update returns (macd, signal).
+    to_dict / from_dict use the keys of the scraper state files.
+    """
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.slow_span = slow
+        self.fast = EMAState(fast, fast)
+        self.slow = EMAState(slow, slow)
+        self.signal = EMAState(signal, signal)
+
+    def update(self, close):
+        self.fast.update(close)
+        self.slow.update(close)
+        if self.slow.count < self.slow_span:
+            return np.nan, np.nan
+        line = self.fast.value - self.slow.value
+        return line, self.signal.update(line)
+
+    @classmethod
+    def from_history(cls, close, fast=12, slow=26, signal=9):
+        """
+        State after a whole close history, using the batch functions
+        """
+        close = _as_array(close)
+        state = cls(fast, slow, signal)
+        if not len(close):
+            return state
+        state.fast.value = float(ema(close, fast)[-1])
+        state.fast.count = state.slow.count = len(close)
+        state.slow.value = float(ema(close, slow)[-1])
+        line = macd(close, fast, slow, signal)[0]
+        line = line[~np.isnan(line)]
+        if len(line):
+            state.signal.value = float(ema(line, signal)[-1])
+            state.signal.count = len(line)
+        return state
+
+    def to_dict(self):
+        return {
+            "n_close": self.fast.count,
+            "ema_fast": self.fast.value,
+            "ema_slow": self.slow.value,
+            "n_macd": self.signal.count,
+            "signal": self.signal.value,
+        }
+
+    @classmethod
+    def from_dict(cls, d, fast=12, slow=26, signal=9):
+        state = cls(fast, slow, signal)
+        state.fast.value, state.fast.count = d["ema_fast"], d["n_close"]
+        state.slow.value, state.slow.count = d["ema_slow"], d["n_close"]
+        state.signal.value, state.signal.count = d["signal"], d["n_macd"]
+        return state
@@ -0,0 +1,211 @@
+# Walk-forward backtest of the registered forecasters over every symbol
+#
+#   python -m models.backtest                                  # ridge and holt, all symbols
+#   python -m models.backtest --models lstm ridge --folds 6 --step 30 BTC ETH
+#   python -m models.backtest --output backtest.csv
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from models.forecast_pipeline import DATA_DIR, ROOT, init_worker, list_symbols
+from models.forecasters import FORECASTERS, TARGETS, WindowForecaster, get_forecaster
+from models.windowing import timesteps_data, timesteps_target
+
+
+CACHE_DIR = os.path.join(ROOT, "models", "backtest_cache")
+
+FOLDS = 10
+# Rows predicted by each fold, one step ahead from the actual candles
+STEP = 30
+MIN_TRAIN_ROWS = 200
+
+
+def fold_origins(n_rows, folds=FOLDS, step=STEP, min_train=MIN_TRAIN_ROWS):
+    """
+    First row of each test block, the last block ends on the last candle
+    """
+    origins = [n_rows - step * k for k in range(folds, 0, -1)]
+    return [origin for origin in origins if origin >= min_train]
+
+
+def fold_key(values, origin, step, model, config):
+    """
+    Hash of the rows a fold sees and of the forecaster settings, so folds
+    stay cached when new candles are appended
+    """
+    h = hashlib.sha1(np.ascontiguousarray(values[: origin + step]).tobytes())
+    h.update(json.dumps([model, config, origin, step], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class FoldCache:
+    """
+    Predictions of each fold stored as .npy under cache_dir/model/symbol
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, model, symbol, key):
+        return os.path.join(self.cache_dir, model, symbol, key + ".npy")
+
+    def load(self, model, symbol, key):
+        path = self.path(model, symbol, key)
+        if os.path.exists(path):
+            return np.load(path)
+        return None
+
+    def save(self, model, symbol, key, preds):
+        path = self.path(model, symbol, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path + ".tmp.npy", preds)
+        os.replace(path + ".tmp.npy", path)
+
+
+def fold_predictions(forecaster, df, values, origins, step):
+    """
+    Yields (origin, predictions of rows origin .. origin + step) fitting on
+    the rows before origin. Window forecasters slice windows built once for
+    the whole history instead of rebuilding them per fold.
+    """
+    if isinstance(forecaster, WindowForecaster):
+        w = forecaster.timesteps_len
+        X = timesteps_data(values, w)
+        Y = timesteps_target(values, w)
+        for origin in origins:
+            forecaster.fit_windows(X[: origin - w], Y[: origin - w])
+            test = slice(origin - w, origin + step - w)
+            yield origin, values[test] * (1 + forecaster.predict_windows(X[test]))
+    else:
+        for origin in origins:
+            yield origin, forecaster.fit_predict(df.iloc[: origin + step], step, 0)
+
+
+def backtest_symbol(symbol, model, config, data_dir, cache_dir, folds, step, min_train):
+    """
+    Runs in a worker process, returns the (rows, 5) predictions and actuals
+    of all folds, fit seconds and the number of folds read from the cache
+    """
+    df = pd.read_csv(os.path.join(data_dir, "{}_OHLC.csv".format(symbol)), parse_dates=["Date"])
+    values = df[TARGETS].to_numpy(dtype=float)
+    origins = fold_origins(len(values), folds, step, min_train)
+    cache = FoldCache(cache_dir)
+
+    preds = {}
+    keys = {origin: fold_key(values, origin, step, model, config) for origin in origins}
+    for origin in origins:
+        cached = cache.load(model, symbol, keys[origin])
+        if cached is not None:
+            preds[origin] = cached
+
+    todo = [origin for origin in origins if origin not in preds]
+    start = time.perf_counter()
+    if todo:
+        forecaster = get_forecaster(model, config)
+        for origin, fold_preds in fold_predictions(forecaster, df, values, todo, step):
+            preds[origin] = fold_preds
+            cache.save(model, symbol, keys[origin], fold_preds)
+    seconds = time.perf_counter() - start
+
+    predicted = np.vstack([preds[origin] for origin in origins])
+    actual = np.vstack([values[origin : origin + step] for origin in origins])
+    return {
+        "predicted": predicted,
+        "actual": actual,
+        "folds": len(origins),
+        "cached": len(origins) - len(todo),
+        "seconds": seconds,
+    }
+
+
+def scores(result):
+    """
+    MAE and MAPE of every target over all the folds of a symbol
+    """
+    error = result["predicted"] - result["actual"]
+    row = {"folds": result["folds"], "cached": result["cached"], "seconds": result["seconds"]}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.abs(error) / np.abs(result["actual"])
+    for j, col in enumerate(TARGETS):
+        row["MAE_" + col] = np.nanmean(np.abs(error[:, j]))
+        row["MAPE_" + col] = np.nanmean(np.where(np.isfinite(ape[:, j]), ape[:, j], np.nan)) * 100
+    return row
+
+
+def run_backtest(symbols, models, configs=None, data_dir=DATA_DIR, cache_dir=CACHE_DIR,
+                 workers=None, folds=FOLDS, step=STEP, min_train=MIN_TRAIN_ROWS):
+    """
+    Returns one row of scores per (model, symbol)
+    """
+    configs = configs or {}
+    jobs = [(model, symbol) for model in models for symbol in symbols]
+    workers = workers or max(1, min(len(jobs), os.cpu_count() or 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(threads,)) as pool:
+        futures = {
+            pool.submit(backtest_symbol, symbol, model, configs.get(model), data_dir,
+                        cache_dir, folds, step, min_train): (model, symbol)
+            for model, symbol in jobs
+        }
+        for future in as_completed(futures):
+            model, symbol = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print("[ERROR]: {} {} failed: {!r}".format(model, symbol, e))
+                continue
+            row = dict(model=model, symbol=symbol, **scores(result))
+            print("[INFO]: {} {} MAPE close {:.2f}% in {:.2f}s ({} of {} folds cached)".format(
+                model, symbol, row["MAPE_close"], row["seconds"], row["cached"], row["folds"]))
+            rows.append(row)
+    return pd.DataFrame(rows).sort_values(["symbol", "model"]).reset_index(drop=True)
+
+
+def summary(table):
+    """
+    Mean scores and total fit time per model
+    """
+    return table.groupby("model").agg(
+        MAE_close=("MAE_close", "mean"),
+        MAPE_close=("MAPE_close", "mean"),
+        MAPE_volume=("MAPE_volume", "mean"),
+        seconds=("seconds", "sum"),
+    ).sort_values("MAPE_close")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the forecasters")
+    parser.add_argument("symbols", nargs="*", help="default: every data/*_OHLC.csv")
+    parser.add_argument("--models", nargs="+", default=["ridge", "holt"], choices=sorted(FORECASTERS))
+    parser.add_argument("--config", help="json file of {model: settings}")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--step", type=int, default=STEP)
+    parser.add_argument("--min-train", type=int, default=MIN_TRAIN_ROWS)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--output", help="write the per symbol table to this csv")
+    args = parser.parse_args()
+
+    configs = None
+    if args.config:
+        with open(args.config) as f:
+            configs = json.load(f)
+
+    table = run_backtest(
+        args.symbols or list_symbols(args.data_dir), args.models, configs, args.data_dir,
+        args.cache_dir, args.workers, args.folds, args.step, args.min_train,
+    )
+    columns = ["symbol", "model", "MAE_close", "MAPE_close", "MAPE_volume", "seconds", "cached"]
+    print(table[columns].to_string(index=False, float_format="{:.3f}".format))
+    print(summary(table).to_string(float_format="{:.3f}".format))
+    if args.output:
+        table.to_csv(args.output, index=False)
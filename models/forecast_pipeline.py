@@ -0,0 +1,195 @@
+# Offline forecasts of every symbol into data/pred/{SYMBOL}_PRED.csv
+#
+#   python -m models.forecast_pipeline                        # LSTM, all symbols
+#   python -m models.forecast_pipeline --model prophet BTC ETH
+#   python -m models.forecast_pipeline --model ridge          # NumPy only, seconds
+#   python -m models.forecast_pipeline --config best.json --force
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from models.forecasters import FORECASTERS, TARGETS, get_forecaster, save_forecaster
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_DIR = os.path.join(ROOT, "data")
+PRED_DIR = os.path.join(DATA_DIR, "pred")
+# Fitted models served by app_inference, models/trained/{model}/{SYMBOL}
+TRAINED_DIR = os.path.join(ROOT, "models", "trained")
+MANIFEST_NAME = "manifest.json"
+
+# Rows of BTC_PRED.csv: 147 days of candles, predictions on the last 58
+# of them and 3 future days
+HISTORY_ROWS = 147
+TEST_ROWS = 58
+HORIZON = 3
+
+
+def list_symbols(data_dir=DATA_DIR):
+    return sorted(f.split("_")[0] for f in os.listdir(data_dir) if f.endswith("_OHLC.csv"))
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(csv_path, model, config, history, test_rows, horizon):
+    """
+    Changes when the candles or anything shaping the forecast change
+    """
+    settings = json.dumps([model, config, history, test_rows, horizon], sort_keys=True)
+    return file_digest(csv_path) + "-" + hashlib.sha1(settings.encode()).hexdigest()[:12]
+
+
+def load_manifest(pred_dir):
+    path = os.path.join(pred_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, pred_dir):
+    path = os.path.join(pred_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def pred_frame(df, preds, history, test_rows, horizon):
+    """
+    Last history candles plus horizon future dates, predicted
+    open/high/low/close/volume in columns 0..4 (the BTC_PRED.csv schema)
+    """
+    out = df[["Date"] + TARGETS].iloc[-history:].reset_index(drop=True)
+    step = out["Date"].iloc[-1] - out["Date"].iloc[-2]
+    future = pd.DataFrame({"Date": [out["Date"].iloc[-1] + step * (i + 1) for i in range(horizon)]})
+    out = pd.concat([out, future], ignore_index=True)
+
+    predicted = np.full((len(out), len(TARGETS)), np.nan)
+    predicted[len(out) - test_rows - horizon :] = preds
+    for j in range(len(TARGETS)):
+        out[str(j)] = predicted[:, j]
+    return out
+
+
+def model_dir(symbol, model, trained_dir=TRAINED_DIR):
+    return os.path.join(trained_dir, model, symbol)
+
+
+def init_worker(threads):
+    """
+    CPU only, and one worker must not grab every core
+    """
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+    for var in ["OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]:
+        os.environ[var] = str(threads)
+
+
+def forecast_symbol(symbol, model, config, data_dir, pred_dir, history, test_rows, horizon, trained_dir=TRAINED_DIR):
+    """
+    Runs in a worker process, returns (symbol, seconds)
+    """
+    start = time.perf_counter()
+    df = pd.read_csv(os.path.join(data_dir, "{}_OHLC.csv".format(symbol)), parse_dates=["Date"])
+    forecaster = get_forecaster(model, config)
+    preds = forecaster.fit_predict(df, test_rows, horizon)
+    save_forecaster(forecaster, model_dir(symbol, model, trained_dir), model=model, config=config,
+                    trained_until=df["Date"].iloc[-test_rows - 1],
+                    history=history, test_rows=test_rows, horizon=horizon)
+    out = pred_frame(df, preds, history, test_rows, horizon)
+    path = os.path.join(pred_dir, "{}_PRED.csv".format(symbol))
+    out.to_csv(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return symbol, time.perf_counter() - start
+
+
+def run_pipeline(symbols, model="lstm", config=None, data_dir=DATA_DIR, pred_dir=PRED_DIR,
+                 workers=None, force=False, history=HISTORY_ROWS, test_rows=TEST_ROWS, horizon=HORIZON,
+                 trained_dir=TRAINED_DIR):
+    """
+    Forecasts the symbols whose candles changed since the last run,
+    returns {symbol: seconds | exception | None when skipped}
+    """
+    os.makedirs(pred_dir, exist_ok=True)
+    manifest = load_manifest(pred_dir)
+    workers = workers or max(1, min(len(symbols), os.cpu_count() or 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    report = {}
+    todo = {}
+    for symbol in symbols:
+        key = fingerprint(os.path.join(data_dir, "{}_OHLC.csv".format(symbol)),
+                          model, config, history, test_rows, horizon)
+        pred_exists = os.path.exists(os.path.join(pred_dir, "{}_PRED.csv".format(symbol)))
+        if not force and pred_exists and manifest.get(symbol) == key:
+            print("[INFO]: {} unchanged, skipped".format(symbol))
+            report[symbol] = None
+        else:
+            todo[symbol] = key
+
+    if not todo:
+        return report
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(threads,)) as pool:
+        futures = {
+            pool.submit(forecast_symbol, symbol, model, config, data_dir, pred_dir,
+                        history, test_rows, horizon, trained_dir): symbol
+            for symbol in todo
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                _, seconds = future.result()
+            except Exception as e:
+                print("[ERROR]: {} failed: {!r}".format(symbol, e))
+                report[symbol] = e
+                continue
+            print("[INFO]: {} forecast in {:.1f}s".format(symbol, seconds))
+            report[symbol] = seconds
+            manifest[symbol] = todo[symbol]
+            save_manifest(manifest, pred_dir)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast every symbol into data/pred")
+    parser.add_argument("symbols", nargs="*", help="default: every data/*_OHLC.csv")
+    parser.add_argument("--model", default="lstm", choices=sorted(FORECASTERS))
+    parser.add_argument("--config", help="json file of forecaster settings")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--force", action="store_true", help="ignore the manifest")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--pred-dir", default=PRED_DIR)
+    parser.add_argument("--trained-dir", default=TRAINED_DIR, help="where the fitted models are saved")
+    parser.add_argument("--history", type=int, default=HISTORY_ROWS)
+    parser.add_argument("--test-rows", type=int, default=TEST_ROWS)
+    parser.add_argument("--horizon", type=int, default=HORIZON)
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    start = time.perf_counter()
+    report = run_pipeline(
+        args.symbols or list_symbols(args.data_dir), args.model, config,
+        args.data_dir, args.pred_dir, args.workers, args.force,
+        args.history, args.test_rows, args.horizon, args.trained_dir,
+    )
+    done = [s for s in report.values() if isinstance(s, float)]
+    failed = [k for k, s in report.items() if isinstance(s, Exception)]
+    print("[INFO]: {} forecast, {} skipped, {} failed in {:.1f}s".format(
+        len(done), sum(s is None for s in report.values()), len(failed), time.perf_counter() - start))
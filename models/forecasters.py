@@ -0,0 +1,395 @@
+"""
+Forecasters extracted from the LSTM and Prophet notebooks.
+
+Every forecaster implements fit_predict(df, test_rows, horizon) on an OHLC
+df and returns a (test_rows + horizon, 5) array of predicted
+open/high/low/close/volume: one step ahead predictions for the last
+test_rows rows, then horizon future rows. predict(df, test_rows, horizon)
+does the same with the already fitted models, which save_forecaster and
+load_forecaster store on disk. Heavy libraries (tensorflow, prophet) are
+only imported when a forecaster is used, ridge and holt are NumPy only.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from models.windowing import timesteps_data, timesteps_target
+
+
+TARGETS = ["open", "high", "low", "close", "volume"]
+
+# Hyperparameters of LSTM_train+testmodel.ipynb
+LSTM_CONFIG = dict(
+    timesteps_len=15,
+    neurons=100,
+    batch_size=64,
+    epochs=60,
+    loss="mse",
+    metrics="mean_absolute_error",
+    active_function="linear",
+    dropout=0.2,
+    optimizer="adam",
+    # Early stopping on the last validation_split of the training windows,
+    # epochs is then an upper bound
+    patience=None,
+    validation_split=0.1,
+)
+
+
+def LSTM_model(input_data, output_size, neurons, active_function, dropout,
+               loss, optimizer, metrics):
+    from keras.layers import Activation, Dense, Dropout, LSTM
+    from keras.models import Sequential
+
+    model = Sequential()
+    model.add(LSTM(neurons, input_shape=(input_data.shape[1], input_data.shape[2])))
+    model.add(Dropout(dropout))
+    model.add(Dense(units=output_size))
+    model.add(Activation(active_function))
+    model.compile(loss=loss, optimizer=optimizer, metrics=metrics)
+    return model
+
+
+class WindowForecaster:
+    """
+    One model per target on first line normalized windows of the 5 OHLCV
+    columns. Future rows are forecast recursively, each predicted row is
+    appended to the window of the next step.
+
+    build_model(X_train) returns an object with fit(X, y, **fit_kwargs) and
+    predict(X), such as a keras model.
+    """
+
+    def __init__(self, build_model, timesteps_len=15, fit_kwargs=None):
+        self.build_model = build_model
+        self.timesteps_len = timesteps_len
+        self.fit_kwargs = fit_kwargs or {}
+        self.models = []
+
+    def fit_windows(self, X_train, Y_train):
+        """
+        Fits on normalized windows and their (samples, targets) next rows
+        """
+        self.models = []
+        for j in range(Y_train.shape[1]):
+            model = self.build_model(X_train)
+            model.fit(X_train, Y_train[:, j], **self.fit_kwargs)
+            self.models.append(model)
+        return self
+
+    def fit(self, values):
+        w = self.timesteps_len
+        return self.fit_windows(timesteps_data(values, w), timesteps_target(values, w))
+
+    def predict_windows(self, X):
+        """
+        Normalized next row of normalized windows
+        """
+        return np.stack([np.ravel(model.predict(X)) for model in self.models], axis=1)
+
+    def predict_next(self, windows):
+        """
+        Next row of each (timesteps, features) window, in price units
+        """
+        windows = np.asarray(windows, dtype=float)
+        first = windows[:, 0, :]
+        return first * (1 + self.predict_windows(windows / first[:, None, :] - 1))
+
+    def forecast_future(self, values, horizon):
+        history = values[-self.timesteps_len :].copy()
+        rows = []
+        for _ in range(horizon):
+            row = self.predict_next(history[None])[0]
+            rows.append(row)
+            history = np.vstack([history[1:], row])
+        return np.array(rows).reshape(horizon, values.shape[1])
+
+    def predict(self, df, test_rows, horizon):
+        values = df[TARGETS].to_numpy(dtype=float)
+        n, w = len(values), self.timesteps_len
+        test_windows = np.stack([values[i : i + w] for i in range(n - test_rows - w, n - w)])
+        test_pred = self.predict_next(test_windows).reshape(test_rows, len(TARGETS))
+        return np.vstack([test_pred, self.forecast_future(values, horizon)])
+
+    def fit_predict(self, df, test_rows, horizon):
+        self.fit(df[TARGETS].to_numpy(dtype=float)[: len(df) - test_rows])
+        return self.predict(df, test_rows, horizon)
+
+    def save(self, path):
+        for col, model in zip(TARGETS, self.models):
+            if hasattr(model, "save"):
+                model.save(os.path.join(path, col + ".keras"))
+            else:
+                with open(os.path.join(path, col + ".pkl"), "wb") as f:
+                    pickle.dump(model, f)
+        return dict(type="window", timesteps_len=self.timesteps_len)
+
+    @classmethod
+    def load(cls, path, meta):
+        forecaster = cls(None, meta["timesteps_len"])
+        for col in TARGETS:
+            keras_path = os.path.join(path, col + ".keras")
+            if os.path.exists(keras_path):
+                from keras.models import load_model
+
+                forecaster.models.append(load_model(keras_path))
+            else:
+                with open(os.path.join(path, col + ".pkl"), "rb") as f:
+                    forecaster.models.append(pickle.load(f))
+        return forecaster
+
+
+def lstm_forecaster(config=None):
+    config = dict(LSTM_CONFIG, **(config or {}))
+
+    def build_model(X_train):
+        return LSTM_model(
+            X_train, output_size=1, neurons=config["neurons"], dropout=config["dropout"],
+            loss=config["loss"], active_function=config["active_function"],
+            optimizer=config["optimizer"], metrics=config["metrics"])
+
+    fit_kwargs = dict(epochs=config["epochs"], batch_size=config["batch_size"], verbose=0, shuffle=True)
+    if config["patience"]:
+        from keras.callbacks import EarlyStopping
+
+        fit_kwargs.update(
+            validation_split=config["validation_split"],
+            callbacks=[EarlyStopping(monitor="val_loss", patience=config["patience"], restore_best_weights=True)],
+        )
+    return WindowForecaster(build_model, timesteps_len=config["timesteps_len"], fit_kwargs=fit_kwargs)
+
+
+class ProphetForecaster:
+    """
+    One Prophet model per target, fitted on the rows before the test rows
+    """
+
+    def __init__(self, **prophet_kwargs):
+        self.prophet_kwargs = prophet_kwargs
+        self.models = []
+
+    def fit(self, df):
+        from prophet import Prophet
+
+        dates = pd.to_datetime(df["Date"]).values
+        self.models = []
+        for col in TARGETS:
+            m = Prophet(**self.prophet_kwargs)
+            m.fit(pd.DataFrame({"ds": dates, "y": df[col].values}))
+            self.models.append(m)
+        return self
+
+    def predict(self, df, test_rows, horizon):
+        dates = pd.to_datetime(df["Date"]).reset_index(drop=True)
+        step = dates.iloc[-1] - dates.iloc[-2]
+        future = pd.DataFrame({
+            "ds": pd.concat([
+                dates.iloc[len(dates) - test_rows :],
+                pd.Series([dates.iloc[-1] + step * (i + 1) for i in range(horizon)]),
+            ], ignore_index=True)
+        })
+        return np.stack([m.predict(future)["yhat"].to_numpy() for m in self.models], axis=1)
+
+    def fit_predict(self, df, test_rows, horizon):
+        self.fit(df.iloc[: len(df) - test_rows])
+        return self.predict(df, test_rows, horizon)
+
+    def save(self, path):
+        from prophet.serialize import model_to_json
+
+        for col, m in zip(TARGETS, self.models):
+            with open(os.path.join(path, col + ".json"), "w") as f:
+                f.write(model_to_json(m))
+        return dict(type="prophet")
+
+    @classmethod
+    def load(cls, path, meta):
+        from prophet.serialize import model_from_json
+
+        forecaster = cls()
+        for col in TARGETS:
+            with open(os.path.join(path, col + ".json")) as f:
+                forecaster.models.append(model_from_json(f.read()))
+        return forecaster
+
+
+def prophet_forecaster(config=None):
+    return ProphetForecaster(**(config or {}))
+
+
+class RidgeRegressor:
+    """
+    Closed form ridge regression on the flattened windows, i.e. on the
+    lagged returns relative to the window first line. Same fit / predict
+    calls as the keras model of LSTM_model, in milliseconds and NumPy only.
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+
+    def fit(self, X, y, **kwargs):
+        A = X.reshape(len(X), -1)
+        y = np.asarray(y, dtype=float)
+        self.x_mean = A.mean(axis=0)
+        self.y_mean = y.mean(axis=0)
+        A = A - self.x_mean
+        gram = A.T @ A
+        gram[np.diag_indices_from(gram)] += self.alpha
+        self.coef = np.linalg.solve(gram, A.T @ (y - self.y_mean))
+        return self
+
+    def predict(self, X):
+        return (X.reshape(len(X), -1) - self.x_mean) @ self.coef + self.y_mean
+
+
+def ridge_model(input_data, output_size=1, alpha=1.0):
+    """
+    Drop-in for LSTM_model: an unfitted model for input_data shaped windows
+    """
+    return RidgeRegressor(alpha)
+
+
+RIDGE_CONFIG = dict(timesteps_len=15, alpha=1.0)
+
+
+def ridge_forecaster(config=None):
+    config = dict(RIDGE_CONFIG, **(config or {}))
+    return WindowForecaster(
+        lambda X_train: ridge_model(X_train, alpha=config["alpha"]),
+        timesteps_len=config["timesteps_len"],
+    )
+
+
+# Smoothing factors tried for the level and the trend of Holt's method
+HOLT_GRID = (0.05, 0.1, 0.2, 0.4, 0.6, 0.8, 0.95)
+
+
+def holt_smooth(values, alpha, beta):
+    """
+    Holt linear exponential smoothing of the columns of values, alpha and
+    beta broadcast against a row (e.g. one factor per column, or a grid of
+    factors with a leading axis). Returns the one step ahead predictions
+    and the final level and trend.
+    """
+    level = values[0] + np.zeros(np.broadcast(alpha, beta, values[0]).shape)
+    trend = values[1] - values[0] + np.zeros_like(level)
+    preds = np.empty((len(values),) + level.shape)
+    preds[0] = values[0]
+    for t in range(1, len(values)):
+        forecast = level + trend
+        preds[t] = forecast
+        new_level = alpha * values[t] + (1 - alpha) * forecast
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+    return preds, level, trend
+
+
+class HoltForecaster:
+    """
+    Holt's linear trend method per target. alpha and beta are picked per
+    target on HOLT_GRID by one step ahead squared error on the training
+    rows, all combinations and targets smoothed in a single pass.
+    """
+
+    def __init__(self, grid=HOLT_GRID):
+        self.grid = grid
+        self.alpha = None
+        self.beta = None
+
+    def _grid_search(self, values, train_rows):
+        """
+        Smooths values with every (alpha, beta) of the grid in one pass,
+        keeps the best pair per target on the first train_rows
+        """
+        alphas, betas = np.meshgrid(self.grid, self.grid, indexing="ij")
+        alphas, betas = alphas.reshape(-1, 1), betas.reshape(-1, 1)
+        preds, level, trend = holt_smooth(values, alphas, betas)
+        errors = ((preds[1:train_rows] - values[1:train_rows, None, :]) ** 2).sum(axis=0)
+        best = errors.argmin(axis=0)
+        self.alpha = alphas[best, 0]
+        self.beta = betas[best, 0]
+        columns = np.arange(values.shape[1])
+        return preds[:, best, columns], level[best, columns], trend[best, columns]
+
+    def fit(self, df):
+        values = df[TARGETS].to_numpy(dtype=float)
+        self._grid_search(values, len(values))
+        return self
+
+    def _forecast(self, preds, level, trend, test_rows, horizon):
+        steps = np.arange(1, horizon + 1)[:, None]
+        future = np.maximum(level + steps * trend, 0)
+        return np.vstack([preds[len(preds) - test_rows :], future])
+
+    def predict(self, df, test_rows, horizon):
+        values = df[TARGETS].to_numpy(dtype=float)
+        preds, level, trend = holt_smooth(values, self.alpha, self.beta)
+        return self._forecast(preds, level, trend, test_rows, horizon)
+
+    def fit_predict(self, df, test_rows, horizon):
+        # The smoothing is causal: one pass over all rows both scores the
+        # grid on the training rows and yields the test predictions
+        values = df[TARGETS].to_numpy(dtype=float)
+        preds, level, trend = self._grid_search(values, len(values) - test_rows)
+        return self._forecast(preds, level, trend, test_rows, horizon)
+
+    def save(self, path):
+        np.savez(os.path.join(path, "holt.npz"), alpha=self.alpha, beta=self.beta)
+        return dict(type="holt")
+
+    @classmethod
+    def load(cls, path, meta):
+        forecaster = cls()
+        with np.load(os.path.join(path, "holt.npz")) as params:
+            forecaster.alpha = params["alpha"]
+            forecaster.beta = params["beta"]
+        return forecaster
+
+
+def holt_forecaster(config=None):
+    return HoltForecaster(**(config or {}))
+
+
+# name -> factory(config) returning a forecaster
+FORECASTERS = {
+    "lstm": lstm_forecaster,
+    "prophet": prophet_forecaster,
+    "ridge": ridge_forecaster,
+    "holt": holt_forecaster,
+}
+
+
+FORECASTER_TYPES = {
+    "window": WindowForecaster,
+    "prophet": ProphetForecaster,
+    "holt": HoltForecaster,
+}
+
+
+def get_forecaster(name, config=None):
+    return FORECASTERS[name](config)
+
+
+def save_forecaster(forecaster, path, **meta):
+    """
+    Stores a fitted forecaster in the path directory, meta.json is written
+    last so its mtime is the version of the saved model
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = dict(forecaster.save(path), **meta)
+    with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f, indent=2, default=str)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+
+def read_forecaster_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def load_forecaster(path):
+    meta = read_forecaster_meta(path)
+    return FORECASTER_TYPES[meta["type"]].load(path, meta)
@@ -0,0 +1,214 @@
+# Hyperparameter sweep of a forecaster, scored by walk-forward backtest
+#
+#   python -m models.sweep                                   # full LSTM grid on BTC ETH
+#   python -m models.sweep --random 20 --seed 1 --workers 4
+#   python -m models.sweep --model ridge BTC ETH SOL
+#   python -m models.forecast_pipeline --config models/sweeps/lstm/best_config.json
+#
+# Finished configs are cached by a hash of the settings and of the symbol
+# csvs, rerunning an interrupted sweep only evaluates the missing ones.
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from models.backtest import CACHE_DIR, backtest_symbol, scores
+from models.forecast_pipeline import DATA_DIR, ROOT, file_digest, init_worker
+
+
+SWEEP_DIR = os.path.join(ROOT, "models", "sweeps")
+
+# Values tried for each setting, the notebook values are included
+SWEEP_SPACES = {
+    "lstm": dict(
+        timesteps_len=[10, 15, 30],
+        neurons=[50, 100, 200],
+        batch_size=[32, 64],
+        epochs=[60, 120],
+        dropout=[0.1, 0.2, 0.3],
+    ),
+    "ridge": dict(
+        timesteps_len=[5, 10, 15, 30, 60],
+        alpha=[0.01, 0.1, 1.0, 10.0],
+    ),
+}
+
+# Settings shared by every config of a sweep
+FIXED_SETTINGS = {
+    "lstm": dict(patience=10),
+}
+
+SYMBOLS = ["BTC", "ETH"]
+FOLDS = 3
+STEP = 30
+MIN_TRAIN_ROWS = 200
+
+
+def grid_configs(space):
+    keys = sorted(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_configs(space, n, seed=None):
+    """
+    n distinct configs sampled from the grid
+    """
+    grid = grid_configs(space)
+    return random.Random(seed).sample(grid, min(n, len(grid)))
+
+
+def data_digests(symbols, data_dir):
+    """
+    Digest of the candles csv of every symbol, so cached results are
+    rerun once the history changes
+    """
+    return {symbol: file_digest(os.path.join(data_dir, "{}_OHLC.csv".format(symbol))) for symbol in symbols}
+
+
+def config_hash(model, config, digests, folds, step, min_train):
+    settings = json.dumps([model, config, digests, folds, step, min_train], sort_keys=True)
+    return hashlib.sha1(settings.encode()).hexdigest()[:16]
+
+
+def cpu_slices(workers):
+    """
+    Disjoint sets of the cores available to this process, one per worker
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    return [list(map(int, part)) for part in np.array_split(cores, min(workers, len(cores)))]
+
+
+def init_pinned_worker(slices):
+    """
+    Pins the worker on the next free set of cores and sizes the TF / OMP
+    thread pools to it
+    """
+    cores = slices.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    init_worker(len(cores))
+
+
+def evaluate_config(model, config, symbols, data_dir, cache_dir, folds, step, min_train):
+    """
+    Runs in a worker process, mean scores of a config over the symbols
+    """
+    start = time.perf_counter()
+    rows = [
+        scores(backtest_symbol(symbol, model, config, data_dir, cache_dir, folds, step, min_train))
+        for symbol in symbols
+    ]
+    return {
+        "MAPE_close": float(np.mean([row["MAPE_close"] for row in rows])),
+        "MAE_close": float(np.mean([row["MAE_close"] for row in rows])),
+        "MAPE_mean": float(np.mean([np.mean([row["MAPE_" + c] for c in ["open", "high", "low", "close"]]) for row in rows])),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def load_results(results_dir):
+    results = {}
+    if os.path.isdir(results_dir):
+        for name in os.listdir(results_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(results_dir, name)) as f:
+                    results[name[:-5]] = json.load(f)
+    return results
+
+
+def save_result(results_dir, key, result):
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, key + ".json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def run_sweep(model, configs, symbols=SYMBOLS, data_dir=DATA_DIR, sweep_dir=SWEEP_DIR,
+              cache_dir=CACHE_DIR, workers=None, folds=FOLDS, step=STEP, min_train=MIN_TRAIN_ROWS):
+    """
+    Evaluates the configs not already in sweep_dir/model/results and
+    returns the leaderboard of all of them, best first
+    """
+    results_dir = os.path.join(sweep_dir, model, "results")
+    results = load_results(results_dir)
+    digests = data_digests(symbols, data_dir)
+    keys = {config_hash(model, config, digests, folds, step, min_train): config for config in configs}
+    todo = {key: config for key, config in keys.items() if key not in results}
+    print("[INFO]: {} configs, {} cached, {} to run".format(len(keys), len(keys) - len(todo), len(todo)))
+
+    if todo:
+        slices = cpu_slices(workers or os.cpu_count() or 1)
+        queue = multiprocessing.Queue()
+        for cores in slices:
+            queue.put(cores)
+        with ProcessPoolExecutor(max_workers=len(slices), initializer=init_pinned_worker, initargs=(queue,)) as pool:
+            futures = {
+                pool.submit(evaluate_config, model, config, symbols, data_dir, cache_dir,
+                            folds, step, min_train): key
+                for key, config in todo.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    result = dict(future.result(), config=todo[key])
+                except Exception as e:
+                    print("[ERROR]: {} failed: {!r}".format(todo[key], e))
+                    continue
+                save_result(results_dir, key, result)
+                results[key] = result
+                print("[INFO]: {} MAPE close {:.3f}% in {:.1f}s".format(todo[key], result["MAPE_close"], result["seconds"]))
+
+    rows = [dict(results[key]["config"], **{k: v for k, v in results[key].items() if k != "config"})
+            for key in keys if key in results]
+    return pd.DataFrame(rows).sort_values("MAPE_close").reset_index(drop=True)
+
+
+def save_best(leaderboard, model, sweep_dir=SWEEP_DIR, fixed=None):
+    """
+    Writes the leaderboard csv and the best config as the json settings
+    read by forecast_pipeline --config
+    """
+    out_dir = os.path.join(sweep_dir, model)
+    os.makedirs(out_dir, exist_ok=True)
+    leaderboard.to_csv(os.path.join(out_dir, "leaderboard.csv"), index=False)
+    space = SWEEP_SPACES[model]
+    best = {k: leaderboard[k].iloc[0] for k in space}
+    best = dict(fixed or {}, **{k: v.item() if hasattr(v, "item") else v for k, v in best.items()})
+    path = os.path.join(out_dir, "best_config.json")
+    with open(path, "w") as f:
+        json.dump(best, f, indent=2, sort_keys=True)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep of a forecaster")
+    parser.add_argument("symbols", nargs="*", default=SYMBOLS)
+    parser.add_argument("--model", default="lstm", choices=sorted(SWEEP_SPACES))
+    parser.add_argument("--random", type=int, help="sample this many configs instead of the full grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--step", type=int, default=STEP)
+    parser.add_argument("--min-train", type=int, default=MIN_TRAIN_ROWS)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--sweep-dir", default=SWEEP_DIR)
+    args = parser.parse_args()
+
+    space = SWEEP_SPACES[args.model]
+    fixed = FIXED_SETTINGS.get(args.model, {})
+    configs = random_configs(space, args.random, args.seed) if args.random else grid_configs(space)
+    configs = [dict(fixed, **config) for config in configs]
+
+    leaderboard = run_sweep(args.model, configs, args.symbols, args.data_dir, args.sweep_dir,
+                            workers=args.workers, folds=args.folds, step=args.step, min_train=args.min_train)
+    print(leaderboard.head(10).to_string(index=False, float_format="{:.3f}".format))
+    print("[INFO]: best config written to " + save_best(leaderboard, args.model, args.sweep_dir, fixed))
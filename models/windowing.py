@@ -0,0 +1,90 @@
+"""
+Sliding window datasets for the LSTM model (see LSTM_train+testmodel.ipynb).
+
+Windows are strided views over the input array; first line normalization
+is a single vectorized divide, or is done per batch by batch_generator so
+the full (samples, timesteps, features) tensor never has to exist.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def train_test_split(df, test_size):
+    split_row = len(df) - int(test_size * len(df))
+    train_data = df.iloc[:split_row]
+    test_data = df.iloc[split_row:]
+    return train_data, test_data
+
+
+def _as_2d(values):
+    x = np.asarray(values, dtype=float)
+    return x[:, None] if x.ndim == 1 else x
+
+
+def window_view(values, timesteps_len):
+    """
+    Zero-copy (samples, timesteps, features) view, window i covers rows
+    i .. i + timesteps_len - 1, for i in range(len(values) - timesteps_len)
+    """
+    x = _as_2d(values)
+    windows = sliding_window_view(x, timesteps_len, axis=0)
+    return windows[: len(x) - timesteps_len].transpose(0, 2, 1)
+
+
+def normalize_withfirstline(windows):
+    return windows / windows[:, :1, :] - 1
+
+
+def timesteps_data(values, timesteps_len, first_line=True):
+    """
+    Vectorized equivalent of the notebook timesteps_data
+    """
+    windows = window_view(values, timesteps_len)
+    if first_line:
+        return normalize_withfirstline(windows)
+    return np.array(windows)
+
+
+def timesteps_target(goal_values, timesteps_len, first_line=True):
+    """
+    Value following each window, relative to the window first line
+    """
+    y = np.asarray(goal_values, dtype=float)
+    target = y[timesteps_len:]
+    if first_line:
+        target = target / y[:-timesteps_len] - 1
+    return target
+
+
+def prepare_data(df, goal, timesteps_len, test_size, first_line=True):
+    train_data, test_data = train_test_split(df, test_size=test_size)
+    X_train = timesteps_data(train_data.values, timesteps_len, first_line)
+    X_test = timesteps_data(test_data.values, timesteps_len, first_line)
+    y_train = timesteps_target(train_data[goal].values, timesteps_len, first_line)
+    y_test = timesteps_target(test_data[goal].values, timesteps_len, first_line)
+    return train_data, test_data, X_train, X_test, y_train, y_test
+
+
+def n_batches(n_rows, timesteps_len, batch_size):
+    return int(np.ceil((n_rows - timesteps_len) / batch_size))
+
+
+def batch_generator(values, goal_values, timesteps_len, batch_size=64, first_line=True, shuffle=True, repeat=True, seed=None):
+    """
+    Yields (X, y) batches built on the fly from the strided view, for
+    model.fit(generator, steps_per_epoch=n_batches(...)). Only one batch is
+    materialized at a time.
+    """
+    windows = window_view(values, timesteps_len)
+    target = timesteps_target(goal_values, timesteps_len, first_line)
+    rng = np.random.default_rng(seed)
+    while True:
+        order = rng.permutation(len(windows)) if shuffle else np.arange(len(windows))
+        for start in range(0, len(order), batch_size):
+            idx = order[start : start + batch_size]
+            batch = windows[idx]
+            if first_line:
+                batch = normalize_withfirstline(batch)
+            yield batch, target[idx]
+        if not repeat:
+            return
@@ -1,28 +1,227 @@
-# Importing libraries 
-from binance.client import Client
+# Importing libraries
+import argparse
 import configparser
+import json
+import os
+import sys
+
 import pandas as pd
 
-# Loading keys from config file
-config = configparser.ConfigParser()
-config.read_file(open(r'C:\Users\swell\OneDrive\Bureau\Data_Science_Fullstack\projet-final\data\secret.cfg'))
-actual_api_key = config.get('BINANCE', 'ACTUAL_API_KEY')
-actual_secret_key = config.get('BINANCE', 'ACTUAL_SECRET_KEY')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app_store import ingest_candles, read_columns, read_meta, replace_file, store_path, write_symbols_manifest
+from indicators import BollingerState, MACDState, add_bollinger, macd
 
-client = Client(actual_api_key, actual_secret_key)
+CONFIG_PATH = r'C:\Users\swell\OneDrive\Bureau\Data_Science_Fullstack\projet-final\data\secret.cfg'
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 
 top20_list = ['BTC', 'ETH', 'BNB', 'XRP', 'ADA', 'DOGE', 'MATIC', 'SOL', 'AVAX', 'XLM', 'DOT', 'UNI', 'LINK', 'BCH', 'LTC', 'GRT', 'ETC', 'FIL', 'AAVE', 'ALGO', 'EOS']
 
-for coin in top20_list:
-    earliest_timestamp = client._get_earliest_valid_timestamp(f'{coin}USDT', '1d')  # Here "ETHUSDT" is a trading pair and "1d" is time interval
-    candle = client.get_historical_klines(f"{coin}USDT", "1d", earliest_timestamp, limit=1000)
-    print(f"Data for coin : {coin}, has been found and downloaded !")
-    coin_df = pd.DataFrame(candle, columns=['Date', 'open', 'high', 'low', 'close', 'volume', 'closeTime', 'quoteAssetVolume', 'numberOfTrades', 'takerBuyBaseVol', 'takerBuyQuoteVol', 'ignore'])
+KLINE_COLUMNS = ['Date', 'open', 'high', 'low', 'close', 'volume', 'closeTime', 'quoteAssetVolume', 'numberOfTrades', 'takerBuyBaseVol', 'takerBuyQuoteVol', 'ignore']
+NUMERIC_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'quoteAssetVolume', 'takerBuyBaseVol', 'takerBuyQuoteVol']
+
+INTERVAL = '1d'
+INTERVAL_MS = 24 * 60 * 60 * 1000
+
+# Intraday intervals only live in the binary store (data/store/{coin}/{interval}),
+# the first run fetches this many days
+INTRADAY_INTERVALS = ['1m', '1h']
+INTRADAY_HISTORY_DAYS = 365
+
+# MACD 12-26-9
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BOLLINGER_RATE = 20
+
+
+def get_client(config_path=CONFIG_PATH):
+    from binance.client import Client
+
+    # Loading keys from config file
+    config = configparser.ConfigParser()
+    config.read_file(open(config_path))
+    actual_api_key = config.get('BINANCE', 'ACTUAL_API_KEY')
+    actual_secret_key = config.get('BINANCE', 'ACTUAL_SECRET_KEY')
+    return Client(actual_api_key, actual_secret_key)
+
+
+def klines_to_df(candle):
+    coin_df = pd.DataFrame(candle, columns=KLINE_COLUMNS)
+    coin_df[NUMERIC_COLUMNS] = coin_df[NUMERIC_COLUMNS].astype(float)
     coin_df.Date = pd.to_datetime(coin_df.Date, unit='ms')
-    coin_df['MACD'] = coin_df['close'].ewm(span=12, adjust=False, min_periods=12).mean() - coin_df['close'].ewm(span=26, adjust=False, min_periods=26).mean()
-    coin_df['MACD_Signal'] = coin_df['MACD'].ewm(span=9, adjust=False, min_periods=9).mean()
     coin_df.closeTime = pd.to_datetime(coin_df.closeTime, unit='ms')
-    coin_df.set_index('Date', inplace=True)
-    coin_df.to_csv(f'./{coin}_OHLC.csv')
+    return coin_df
+
+
+def add_indicators(coin_df):
+    """
+    Materialize MACD and the Bollinger bands over the full history
+    """
+    coin_df['MACD'], coin_df['MACD_Signal'] = macd(coin_df['close'], MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+    return add_bollinger(coin_df, BOLLINGER_RATE)
+
+
+def macd_state(coin_df):
+    """
+    EWM state after the last row of coin_df, enough to continue MACD on new candles
+    """
+    state = MACDState.from_history(coin_df['close'], MACD_FAST, MACD_SLOW, MACD_SIGNAL).to_dict()
+    state['Date'] = coin_df['Date'].iloc[-1].isoformat()
+    return state
+
+
+def macd_tail(close, state):
+    """
+    Continue MACD / MACD_Signal over new closes from a stored EWM state.
+    Returns the two columns and the state after each row.
+    """
+    ewm = MACDState.from_dict(state, MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+    macd_values, signal_values, states = [], [], []
+    for value in close:
+        line, signal = ewm.update(value)
+        macd_values.append(line)
+        signal_values.append(signal)
+        states.append(ewm.to_dict())
+    return macd_values, signal_values, states
+
+
+def state_path(coin, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'{coin}_OHLC.state.json')
+
+
+def load_state(coin, data_dir=DATA_DIR):
+    try:
+        with open(state_path(coin, data_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(coin, state, data_dir=DATA_DIR):
+    replace_file(state_path(coin, data_dir), json.dumps(state).encode())
+
+
+def save_coin_df(coin, coin_df, data_dir=DATA_DIR):
+    # Written to a temporary file then swapped in, readers never see a partial csv
+    replace_file(os.path.join(data_dir, f'{coin}_OHLC.csv'), coin_df.set_index('Date').to_csv().encode())
+
+
+def full_refresh(client, coin, data_dir=DATA_DIR, now=None):
+    """
+    Download the whole history of a coin and rewrite its csv
+    """
+    now = pd.Timestamp.utcnow().tz_localize(None) if now is None else now
+    earliest_timestamp = client._get_earliest_valid_timestamp(f'{coin}USDT', INTERVAL)  # Here "ETHUSDT" is a trading pair and "1d" is time interval
+    candle = client.get_historical_klines(f"{coin}USDT", INTERVAL, earliest_timestamp, limit=1000)
+    coin_df = add_indicators(klines_to_df(candle))
+    save_coin_df(coin, coin_df, data_dir)
+
+    closed = coin_df[coin_df.closeTime < now]
+    if len(closed):
+        save_state(coin, macd_state(closed), data_dir)
+    return len(coin_df)
+
+
+def incremental_refresh(client, coin, data_dir=DATA_DIR, now=None):
+    """
+    Fetch only the klines after the last closed stored candle, append them and
+    continue MACD from the stored EWM state. The still open candle of the
+    previous run is replaced. Returns the number of fetched rows.
+    """
+    now = pd.Timestamp.utcnow().tz_localize(None) if now is None else now
+    stored = pd.read_csv(os.path.join(data_dir, f'{coin}_OHLC.csv'), parse_dates=['Date', 'closeTime'])
+
+    state = load_state(coin, data_dir)
+    if state is None:
+        closed = stored[stored.closeTime < now]
+        state = macd_state(closed)
+    last_closed = pd.Timestamp(state['Date'])
+    stored = stored[stored.Date <= last_closed]
+    if 'bol_up' not in stored.columns:
+        add_bollinger(stored, BOLLINGER_RATE)
+
+    start = int(last_closed.value // 10 ** 6) + INTERVAL_MS
+    candle = client.get_historical_klines(f"{coin}USDT", INTERVAL, start, limit=1000)
+    if not candle:
+        return 0
+
+    new_df = klines_to_df(candle)
+    macd_values, signal_values, states = macd_tail(new_df['close'], state)
+    new_df['MACD'] = macd_values
+    new_df['MACD_Signal'] = signal_values
+
+    # Bollinger bands only need the last closes of the stored history
+    bollinger = BollingerState(BOLLINGER_RATE, values=stored['close'].iloc[-(BOLLINGER_RATE - 1):])
+    new_df['bol_up'], new_df['SMA_20'], new_df['bol_down'] = zip(*[bollinger.update(value) for value in new_df['close']])
+
+    coin_df = pd.concat([stored, new_df], ignore_index=True)
+    save_coin_df(coin, coin_df, data_dir)
+
+    is_closed = (new_df.closeTime < now).values
+    if is_closed.any():
+        last = is_closed.nonzero()[0][-1]
+        new_state = states[last]
+        new_state['Date'] = new_df['Date'].iloc[last].isoformat()
+        save_state(coin, new_state, data_dir)
+    return len(new_df)
+
+
+def refresh_store(client, coin, interval, data_dir=DATA_DIR, days=INTRADAY_HISTORY_DAYS, now=None):
+    """
+    Append the intraday klines from the last stored candle on (it may have
+    been fetched while open) to the binary store, then roll them up to the
+    coarser resolutions. Returns the number of fetched rows.
+    """
+    now = pd.Timestamp.utcnow().tz_localize(None) if now is None else now
+    store_dir = os.path.join(data_dir, 'store')
+    path = store_path(coin, interval, store_dir)
+    meta = read_meta(path)
+    if meta is not None and meta['rows']:
+        last = read_columns(path, meta)['Date'].values[-1]
+        start = int(last.astype('datetime64[ms]').astype('int64'))
+    else:
+        start = int((now - pd.Timedelta(days=days)).value // 10 ** 6)
+
+    candle = client.get_historical_klines(f"{coin}USDT", interval, start, limit=1000)
+    if not candle:
+        return 0
+    ingest_candles(coin, klines_to_df(candle), interval, data_dir, store_dir)
+    return len(candle)
+
+
+def refresh_coin(client, coin, data_dir=DATA_DIR, full=False, interval=INTERVAL):
+    if interval in INTRADAY_INTERVALS:
+        return refresh_store(client, coin, interval, data_dir)
+    if full or not os.path.exists(os.path.join(data_dir, f'{coin}_OHLC.csv')):
+        return full_refresh(client, coin, data_dir)
+    return incremental_refresh(client, coin, data_dir)
+
+
+if __name__ == "__main__":
+    from functools import partial
+
+    from ingest_scheduler import WEIGHT_LIMIT_PER_MINUTE, ingest_all
+
+    parser = argparse.ArgumentParser(description='Scrape the klines of the top 20 coins')
+    parser.add_argument('--full', action='store_true', help='re-download the whole history')
+    parser.add_argument('--interval', default=INTERVAL, choices=[INTERVAL] + INTRADAY_INTERVALS, help='intraday klines go to the binary store')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--weight-limit', type=int, default=WEIGHT_LIMIT_PER_MINUTE, help='request weight allowed per minute')
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--fake', action='store_true', help='use the offline fake client built from --data-dir')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency injected per fake request, in seconds')
+    args = parser.parse_args()
+
+    if args.fake:
+        from fake_client import FakeClient
+        client = FakeClient.from_csv(args.data_dir, top20_list, latency=args.latency)
+    else:
+        client = get_client()
+
+    refresh = partial(refresh_coin, data_dir=args.data_dir, full=args.full, interval=args.interval)
+    results = ingest_all(client, top20_list, refresh, workers=args.workers, weight_limit=args.weight_limit, retries=args.retries)
+    write_symbols_manifest(args.data_dir)
 
-print("All Data was scraped ! It has been saved in .csv format !")
\ No newline at end of file
+    if any(isinstance(rows, Exception) for rows, _ in results.values()):
+        print("Some coins failed, see above !")
+    else:
+        print("All Data was scraped ! It has been saved in .csv format !")
@@ -0,0 +1,88 @@
+# Offline stand-in for binance.client.Client, serves klines from fixtures
+import os
+import time
+
+import pandas as pd
+
+
+def df_to_klines(df):
+    """
+    Convert an OHLC df (as stored in data/) back to binance kline rows
+    """
+    open_time = pd.to_datetime(df["Date"]).values.astype("datetime64[ms]").astype("int64")
+    close_time = pd.to_datetime(df["closeTime"]).values.astype("datetime64[ms]").astype("int64")
+    price_cols = ["open", "high", "low", "close", "volume"]
+    quote_cols = ["quoteAssetVolume"]
+    taker_cols = ["takerBuyBaseVol", "takerBuyQuoteVol"]
+    klines = []
+    for i, (prices, quote, trades, taker) in enumerate(
+        zip(
+            df[price_cols].to_numpy(),
+            df[quote_cols].to_numpy(),
+            df["numberOfTrades"].to_numpy(),
+            df[taker_cols].to_numpy(),
+        )
+    ):
+        klines.append(
+            [int(open_time[i])]
+            + ["{:.8f}".format(v) for v in prices]
+            + [int(close_time[i])]
+            + ["{:.8f}".format(v) for v in quote]
+            + [int(trades)]
+            + ["{:.8f}".format(v) for v in taker]
+            + ["0"]
+        )
+    return klines
+
+
+class FakeClient:
+    """
+    Implements the subset of binance Client used by the scrapers.
+    klines maps a pair (e.g. "BTCUSDT") to its list of kline rows.
+    """
+
+    def __init__(self, klines=None, latency=0.0):
+        self.klines = klines or {}
+        self.latency = latency
+        self.calls = []
+
+    @classmethod
+    def from_csv(cls, data_dir, symbols=None, until=None, latency=0.0):
+        """
+        Build the fixtures from data/{symbol}_OHLC.csv. Rows after `until`
+        are served but the caller can truncate the stored csv to simulate
+        an outdated history.
+        """
+        if symbols is None:
+            symbols = [
+                f.replace("_OHLC.csv", "")
+                for f in os.listdir(data_dir)
+                if f.endswith("_OHLC.csv")
+            ]
+        klines = {}
+        for symbol in symbols:
+            df = pd.read_csv(os.path.join(data_dir, "{}_OHLC.csv".format(symbol)))
+            if until is not None:
+                df = df[pd.to_datetime(df["Date"]) <= pd.to_datetime(until)]
+            klines["{}USDT".format(symbol)] = df_to_klines(df)
+        return cls(klines, latency=latency)
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get_earliest_valid_timestamp(self, symbol, interval):
+        self.calls.append(("_get_earliest_valid_timestamp", symbol, interval))
+        self._sleep()
+        return self.klines[symbol][0][0]
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, limit=1000):
+        self.calls.append(("get_historical_klines", symbol, interval, start_str))
+        self._sleep()
+        start = int(start_str) if start_str is not None else 0
+        end = int(end_str) if end_str is not None else None
+        return [
+            list(k)
+            for k in self.klines.get(symbol, [])
+            if k[0] >= start and (end is None or k[0] <= end)
+        ]
@@ -0,0 +1,115 @@
+# Concurrent multi-symbol ingestion with a rate limit aware scheduler
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+INTERVAL_MS = {
+    '1m': 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+# Binance request weights (spot api), per minute limit shared by the ip
+WEIGHT_LIMIT_PER_MINUTE = 1200
+KLINES_WEIGHT = 2
+EARLIEST_TIMESTAMP_WEIGHT = 2
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket, acquire blocks until enough weight is available
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def acquire(self, weight=1):
+        weight = min(weight, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.refill_per_second
+            time.sleep(wait)
+
+
+class RateLimitedClient:
+    """
+    Wraps a binance-like client and charges the request weight of every
+    call to a shared token bucket
+    """
+
+    def __init__(self, client, bucket, limit=1000):
+        self.client = client
+        self.bucket = bucket
+        self.limit = limit
+
+    def _get_earliest_valid_timestamp(self, symbol, interval):
+        self.bucket.acquire(EARLIEST_TIMESTAMP_WEIGHT)
+        return self.client._get_earliest_valid_timestamp(symbol, interval)
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, limit=1000):
+        # The client pages through the range, one request per `limit` klines
+        now_ms = int(time.time() * 1000)
+        start = int(start_str) if start_str is not None else 0
+        end = int(end_str) if end_str is not None else now_ms
+        pages = max(1, math.ceil((end - start) / INTERVAL_MS.get(interval, INTERVAL_MS['1d']) / limit))
+        self.bucket.acquire(pages * KLINES_WEIGHT)
+        return self.client.get_historical_klines(symbol, interval, start_str, end_str, limit=limit)
+
+
+def with_retry(func, retries=3, backoff=1.0):
+    """
+    Call func, retrying with exponential backoff and jitter on failure
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random() * 0.1))
+
+
+def ingest_all(client, coins, refresh, workers=4, weight_limit=WEIGHT_LIMIT_PER_MINUTE, retries=3, backoff=1.0):
+    """
+    Run refresh(client, coin) for every coin over a thread pool sharing one
+    rate limited client. Returns {coin: (rows or exception, seconds)}.
+    """
+    bucket = TokenBucket(weight_limit, weight_limit / 60)
+    limited_client = RateLimitedClient(client, bucket)
+
+    def job(coin):
+        start = time.perf_counter()
+        try:
+            rows = with_retry(lambda: refresh(limited_client, coin), retries, backoff)
+        except Exception as e:
+            rows = e
+        return coin, rows, time.perf_counter() - start
+
+    results = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(job, coin) for coin in coins]
+        for i, future in enumerate(as_completed(futures), 1):
+            coin, rows, seconds = future.result()
+            results[coin] = (rows, seconds)
+            if isinstance(rows, Exception):
+                print(f"[{i}/{len(coins)}] {coin} failed after {seconds:.2f}s : {rows!r}")
+            else:
+                print(f"[{i}/{len(coins)}] {coin} : {rows} rows in {seconds:.2f}s")
+    print(f"Ingested {len(coins)} coins with {workers} workers in {time.perf_counter() - start:.2f}s")
+    return results